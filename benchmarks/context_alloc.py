@@ -0,0 +1,120 @@
+"""Allocations and time per NebuloidContext and per hook call.
+
+Compares the current NebuloidContext with the previous one, which copied
+every service into a fresh instance __dict__ (services.inject_services).
+
+    python -m benchmarks.context_alloc [iterations]   (from the repository root)
+"""
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+
+from nebuloid.api.context import NebuloidContext
+from nebuloid.core.services import NebuloidServices
+from nebuloid.manifest.manifest import freeze
+from nebuloid.plugins import NebuloidPluginManager, manager
+
+class InjectedContext:
+    """NebuloidContext before __slots__: every service copied onto the instance."""
+    def __init__(self, services, args=None, kwargs=None, user=None, guest=None):
+        services.inject_services(self)
+        self.args = args
+        self.kwargs = kwargs
+        self._loader = None
+        self._user = user
+        self._guest = guest
+        self.plugin_name = None
+
+    async def prepare(self, func):
+        pass
+
+def app_services():
+    # the services of a running app, by name; only their count matters here
+    manifest = type("Manifest", (), {"data": freeze({"hooks": {}, "plugins": {}}), "plugin_registry": {}})()
+    storage = type("Storage", (), {"dir": lambda self, name: None})()
+    services = NebuloidServices(orm=object(), manifest=manifest, tools=object(), expose_api=object(), storage=storage, use_flask=False)
+    plugins = NebuloidPluginManager(services)
+    services.add(plugins=plugins, api=object(), builder=object())
+    plugins.mount()
+    return services, plugins
+
+def blocks_per_call(func, n):
+    """Memory blocks still allocated per call, with every result kept alive."""
+    gc.collect()
+    gc.disable()
+    try:
+        keep = [None] * n
+        before = sys.getallocatedblocks()
+        for i in range(n):
+            keep[i] = func()
+        return (sys.getallocatedblocks() - before) / n
+    finally:
+        gc.enable()
+
+def bytes_per_call(func, n):
+    tracemalloc.start()
+    try:
+        keep = [None] * n
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(n):
+            keep[i] = func()
+        return (tracemalloc.get_traced_memory()[0] - before) / n
+    finally:
+        tracemalloc.stop()
+
+def us_per_call(func, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - started) / n * 1e6
+
+def main(n=50000):
+    services, plugins = app_services()
+
+    print(f"{'context':<16}{'blocks':>8}{'bytes':>8}{'us':>8}")
+    for label, cls in (("before (dict)", InjectedContext), ("after (slots)", NebuloidContext)):
+        make = lambda: cls(services, args=(), kwargs=None)
+        print(f"{label:<16}{blocks_per_call(make, n):>8.2f}{bytes_per_call(make, n):>8.1f}{us_per_call(make, n):>8.2f}")
+
+    # the handler keeps every context it gets, so what a request leaves allocated can be counted
+    kept = []
+    async def handler(ctx):
+        kept.append(ctx)
+        return ctx.orm is not None
+    plugins.register_hook("on_request", handler)
+
+    async def hooks():
+        for _ in range(1000):  # warm up
+            await plugins.hook("on_request", path="/")
+        kept.clear()
+
+        gc.collect()
+        gc.disable()
+        try:
+            before = sys.getallocatedblocks()
+            for _ in range(n):
+                await plugins.hook("on_request", path="/")
+            blocks = (sys.getallocatedblocks() - before) / n
+        finally:
+            gc.enable()
+        kept.clear()
+
+        started = time.perf_counter()
+        for _ in range(n):
+            await plugins.hook("on_request", path="/")
+        kept.clear()
+        return blocks, (time.perf_counter() - started) / n * 1e6
+
+    print(f"\n{'on_request hook':<16}{'blocks':>8}{'us':>8}")
+    for label, cls in (("before (dict)", InjectedContext), ("after (slots)", NebuloidContext)):
+        manager.NebuloidContext = cls
+        try:
+            blocks, us = asyncio.run(hooks())
+        finally:
+            manager.NebuloidContext = NebuloidContext
+        print(f"{label:<16}{blocks:>8.2f}{us:>8.2f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -1,20 +1,27 @@
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.exceptions import InvalidTag
 import base64, os
 import secrets
+import asyncio
 import json
+import time
 
+from nebuloid.core.cache import NebuloidCache
 from .auth import NebuloidAuth
 from .data import NebuloidDataAPI
 
-def aes_encrypt(aes_key_bytes: bytes, plaintext: str) -> dict:
+BINARY_MIME = "application/octet-stream"
+STREAM_MIME = "application/x-nebuloid-frames"
+TICKET_AAD = b"nebuloid-session-ticket"
+
+def aes_encrypt(aesgcm: AESGCM, plaintext: bytes) -> dict:
     # Generate random 96-bit (12 byte) nonce
     nonce = os.urandom(12)
-    aesgcm = AESGCM(aes_key_bytes)
 
-    # Encrypt (plaintext must be bytes)
-    ciphertext = aesgcm.encrypt(nonce, plaintext.encode(), None)
+    ciphertext = aesgcm.encrypt(nonce, plaintext, None)
 
     return {
         "nonce": base64.b64encode(nonce).decode(),
@@ -22,14 +29,29 @@ def aes_encrypt(aes_key_bytes: bytes, plaintext: str) -> dict:
     }
 
 
-def aes_decrypt(aes_key_bytes: bytes, data: dict) -> str:
+def aes_decrypt(aesgcm: AESGCM, data: dict) -> bytes:
     nonce = base64.b64decode(data["nonce"])
     ciphertext = base64.b64decode(data["ciphertext"])
 
-    aesgcm = AESGCM(aes_key_bytes)
-    plaintext_bytes = aesgcm.decrypt(nonce, ciphertext, None)
+    return aesgcm.decrypt(nonce, ciphertext, None)
+
+
+# Binary wire format: a frame is the 12 byte nonce followed by the raw ciphertext
+def aes_seal(aesgcm: AESGCM, plaintext: bytes) -> bytes:
+    nonce = os.urandom(12)
+    return nonce + aesgcm.encrypt(nonce, plaintext, None)
+
 
-    return plaintext_bytes.decode()
+def aes_open(aesgcm: AESGCM, frame: bytes) -> bytes:
+    frame = memoryview(frame)
+    return aesgcm.decrypt(frame[:12], frame[12:], None)
+
+
+# Streams are a sequence of sealed frames, each prefixed with its 4 byte big-endian length
+async def aes_stream(aesgcm: AESGCM, messages):
+    async for message in messages:
+        frame = aes_seal(aesgcm, json.dumps(message).encode())
+        yield len(frame).to_bytes(4, "big") + frame
 
 
 class NebuloidAPI:
@@ -38,98 +60,328 @@ class NebuloidAPI:
 
         self.auth = NebuloidAuth(services)
         self.dataapi = NebuloidDataAPI(services)
+        self.ciphers = NebuloidCache(max_entries=10000)  # aes key bytes -> AESGCM
     
     def mount(self):
         private_key = self.storage.file('private_key.pem', "rb")
         with private_key as f:
             self.private_key = serialization.load_pem_private_key(f.read(), password=None)
 
-    async def handle(self, url, content, session_id) -> dict:
-        if url != "/api":
-            if (existing := await self.orm.get_key(session_id)) is not None:
-                aes_key = existing.key
-            else:
-                if self.use_flask:
-                    from flask import jsonify, make_response
-                    response = make_response(jsonify({"error": "invalid_session"}), 403)
-                else:
-                    from quart import jsonify, make_response
-                    response = await make_response(jsonify({"error": "invalid_session"}), 403)
-
-                response.set_cookie(
-                    "session_id",
-                    value="",
-                    max_age=0,
-                    expires=0,
-                    path="/",
-                    secure=True,
-                    httponly=True,
-                    samesite="Lax"
-                )
-
-                return response
+        api_conf = self.manifest.data.get('api', {})
+        self.session_mode = api_conf.get('session_mode', 'db')  # "db" or "ticket"
+        self.ticket_ttl = api_conf.get('ticket_ttl', 3600)
+        self.ws_revalidate = api_conf.get('ws_revalidate', 10)  # seconds a socket reuses its user
+        if self.session_mode == "ticket":
+            # every worker derives the same ticket key from the RSA key pair
+            private_der = self.private_key.private_bytes(
+                serialization.Encoding.DER,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption()
+            )
+            ticket_key = HKDF(
+                algorithm=hashes.SHA256(), length=32, salt=None, info=TICKET_AAD
+            ).derive(private_der)
+            self.ticket_aead = AESGCM(ticket_key)
 
-            api_name = url[5:]
+        self.ciphers = NebuloidCache(
+            max_entries=self.manifest.data.get("cache", {}).get("session_keys", {}).get("max_entries", 10000)
+        )
 
-            data = aes_decrypt(aes_key, json.loads(content).get("data"))
+        self.auth.mount()
 
-            resp_data, resp_code =  await self.handle_raw(api_name, json.loads(data), session_id=session_id)
-            if self.use_flask:
-                from flask import jsonify, make_response
-                return make_response(jsonify(aes_encrypt(aes_key, json.dumps(resp_data))), resp_code)
-            else:
-                from quart import jsonify, make_response
-                return await make_response(jsonify(aes_encrypt(aes_key, json.dumps(resp_data))), resp_code)
-            
-        data = json.loads(content).get("data")
-        
-        # Decrypt
-        decrypted = self.private_key.decrypt(
-            base64.b64decode(data),
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        data = json.loads(decrypted.decode())
+    def cipher(self, aes_key_bytes: bytes) -> AESGCM:
+        """AESGCM object for a session key, reused across that session's messages."""
+        aesgcm = self.ciphers.get(aes_key_bytes)
+        if aesgcm is None:
+            aesgcm = AESGCM(aes_key_bytes)
+            self.ciphers.set(aes_key_bytes, aesgcm)
+        return aesgcm
 
+    async def respond_stream(self, chunks, mimetype):
+        if self.use_flask:
+            from flask import Response
+            return Response(self.tools.iter_sync(chunks), mimetype=mimetype)
+        from quart import Response
+        response = Response(chunks, mimetype=mimetype)
+        response.timeout = None  # large exports may outlive the default response timeout
+        return response
 
-        if not session_id:
-            session_id = secrets.token_urlsafe(32)
-            await self.orm.add_key(session_id, base64.b64decode(data['key']))
+    async def respond(self, body, code=200, mimetype=None):
+        if self.use_flask:
+            from flask import make_response
+            response = make_response(body, code)
         else:
-            if existing := await self.orm.get_key(session_id):
-                await self.orm.update_key(session_id, base64.b64decode(data['key']))
-            else:
-                await self.orm.add_key(session_id, base64.b64decode(data['key']))
+            from quart import make_response
+            response = await make_response(body, code)
+        if mimetype:
+            response.mimetype = mimetype
+        return response
+
+    def issue_ticket(self, session_id: str, aes_key_bytes: bytes) -> str:
+        """Wrap the session's AES key under the server ticket key: the cookie is the session."""
+        sid = base64.urlsafe_b64decode(session_id)
+        issued = int(time.time()).to_bytes(8, "big")
+        nonce = os.urandom(12)
+        sealed = self.ticket_aead.encrypt(nonce, sid + issued + aes_key_bytes, TICKET_AAD)
+        return base64.urlsafe_b64encode(nonce + sealed).decode()
+
+    def open_ticket(self, ticket: str):
+        """Return (session_id, aes_key_bytes, issued) for a valid ticket, (None, None, None) otherwise."""
+        try:
+            raw = base64.urlsafe_b64decode(ticket)
+            plain = self.ticket_aead.decrypt(raw[:12], raw[12:], TICKET_AAD)
+        except (InvalidTag, ValueError, TypeError):
+            return None, None, None
+        sid, issued, aes_key_bytes = plain[:16], int.from_bytes(plain[16:24], "big"), plain[24:]
+        if time.time() - issued > self.ticket_ttl:
+            return None, None, None
+        return base64.urlsafe_b64encode(sid).decode(), aes_key_bytes, issued
+
+    def new_ticket_session(self):
+        return base64.urlsafe_b64encode(os.urandom(16)).decode()
+
+    def resolve_session(self, cookie):
+        """Session id used for login state, from the raw session_id cookie."""
+        if not cookie or self.session_mode != "ticket":
+            return cookie
+        session_id, _, _ = self.open_ticket(cookie)
+        return session_id
+
+    async def session_key(self, cookie):
+        """Return (session_id, aes_key_bytes, issued) for the session cookie; issued is only known for tickets."""
+        if not cookie:
+            return None, None, None
+        if self.session_mode == "ticket":
+            return self.open_ticket(cookie)
+        if (existing := await self.orm.get_key(cookie)) is not None:
+            return cookie, existing.key, None
+        return None, None, None
+
+    async def reload_key(self, session_id, aes_key):
+        """The stored key of a session whose cached key failed to decrypt, None when it is the same or gone.
+
+        Another worker may have re-keyed the session (update_key) after this one cached it.
+        """
+        if self.session_mode == "ticket":
+            return None  # the key travels in the cookie, there is nothing to reload
+        self.orm.key_cache.pop(session_id)
+        stored = await self.orm.get_key(session_id)
+        if stored is None or stored.key == aes_key:
+            return None
+        return stored.key
 
-        resp_data = {'info': "com_ok", "session": session_id}
+    def open_request(self, aes_key, content, binary):
+        """Decrypted request body, None when it wasn't sealed with aes_key."""
+        aesgcm = self.cipher(aes_key)
+        try:
+            if binary:
+                return aes_open(aesgcm, content)
+            return aes_decrypt(aesgcm, json.loads(content).get("data"))
+        except InvalidTag:
+            return None
 
+    async def invalid_session(self):
+        """403 for an unknown, expired or undecryptable session, clearing its cookie."""
         if self.use_flask:
             from flask import jsonify, make_response
-            response = make_response(jsonify(aes_encrypt(base64.b64decode(data['key']), json.dumps(resp_data))), 200)
+            response = make_response(jsonify({"error": "invalid_session"}), 403)
         else:
             from quart import jsonify, make_response
-            response = await make_response(jsonify(aes_encrypt(base64.b64decode(data['key']), json.dumps(resp_data))), 200)
+            response = await make_response(jsonify({"error": "invalid_session"}), 403)
 
+        response.set_cookie(
+            "session_id",
+            value="",
+            max_age=0,
+            expires=0,
+            path="/",
+            secure=True,
+            httponly=True,
+            samesite="Lax"
+        )
+        return response
+
+    async def reissue_ticket(self, session_id, aes_key, issued, request):
+        """Cookie value replacing the caller's ticket, None to keep it.
+
+        Logout moves the client to a fresh session id (the old one is revoked);
+        tickets past half their lifetime are renewed along with their login row.
+        """
+        if self.session_mode != "ticket":
+            return None
+        if isinstance(request, dict) and request.get("info") == "logout":
+            return self.issue_ticket(self.new_ticket_session(), aes_key)
+        if time.time() - issued > self.ticket_ttl / 2 and await self.orm.refresh_login(session_id):
+            return self.issue_ticket(session_id, aes_key)
+        return None
+
+    def set_session_cookie(self, response, cookie):
+        # a ticket is useless once expired, so its cookie lives exactly as long
+        max_age = self.ticket_ttl if self.session_mode == "ticket" else 3600
         response.set_cookie(
             "session_id",               # cookie name
-            value=session_id,           # cookie value
-            max_age=3600,               # optional, seconds
+            value=cookie,               # cookie value
+            max_age=max_age,            # optional, seconds
             httponly=True,              # cannot be accessed by JS
             secure=True,                # HTTPS only
             samesite="Lax"              # Lax/Strict/None
         )
 
+    def decrypt_handshake(self, data: str) -> dict:
+        decrypted = self.private_key.decrypt(
+            base64.b64decode(data),
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+        return json.loads(decrypted.decode())
+
+    async def handle(self, url, content, session_id, content_type=None) -> dict:
+        # session_id is the raw cookie value: a session id, or a ticket in ticket mode
+        if url != "/api":
+            session_id, aes_key, issued = await self.session_key(session_id)
+            if aes_key is None:
+                return await self.invalid_session()
+
+            api_name = url[5:]
+
+            # clients negotiate the binary framing through the request content type
+            binary = (content_type or "").startswith(BINARY_MIME)
+            data = self.open_request(aes_key, content, binary)
+            if data is None and (aes_key := await self.reload_key(session_id, aes_key)) is not None:
+                data = self.open_request(aes_key, content, binary)
+            if data is None:
+                return await self.invalid_session()
+            aesgcm = self.cipher(aes_key)
+
+            request = json.loads(data)
+            if api_name == "stream":
+                messages = self.dataapi.stream(request, session_id=session_id)
+                response = await self.respond_stream(aes_stream(aesgcm, messages), STREAM_MIME)
+            else:
+                resp_data, resp_code =  await self.handle_raw(api_name, request, session_id=session_id)
+                resp_plain = json.dumps(resp_data).encode()
+                if binary:
+                    response = await self.respond(aes_seal(aesgcm, resp_plain), resp_code, BINARY_MIME)
+                else:
+                    response = await self.respond(json.dumps(aes_encrypt(aesgcm, resp_plain)), resp_code, "application/json")
+
+            if cookie := await self.reissue_ticket(session_id, aes_key, issued, request if api_name == "auth" else None):
+                self.set_session_cookie(response, cookie)
+            return response
+            
+        data = json.loads(content).get("data")
+        
+        # Decrypt (RSA-OAEP is CPU bound, keep it off the event loop)
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.decrypt_handshake, data)
+        aes_key = base64.b64decode(data['key'])
+
+        if self.session_mode == "ticket":
+            # keep the session id (and so the login state) of a still valid, unrevoked ticket
+            session_id = self.resolve_session(session_id)
+            if not session_id or not await self.orm.refresh_login(session_id):
+                session_id = self.new_ticket_session()
+            cookie = self.issue_ticket(session_id, aes_key)
+        else:
+            if not session_id:
+                session_id = secrets.token_urlsafe(32)
+                await self.orm.add_key(session_id, aes_key)
+            elif not await self.orm.update_key(session_id, aes_key):
+                await self.orm.add_key(session_id, aes_key)
+            cookie = session_id
+
+        resp_data = {'info': "com_ok", "session": cookie}
+        resp_body = aes_encrypt(self.cipher(aes_key), json.dumps(resp_data).encode())
+        response = await self.respond(json.dumps(resp_body), 200, "application/json")
+        self.set_session_cookie(response, cookie)
         return response
     
-    async def handle_raw(self, api_name, data, session_id=None, user_id=None):
+    async def handle_ws(self, websocket, cookie):
+        """Serve /api_ws: auth, data and batch calls multiplexed over one socket.
+
+        Every message is a sealed frame holding {"id", "api", "data"}; replies carry
+        the same id with {"code", "data"}. The session is re-checked on every message
+        (a cache hit, or a ticket decryption) and the user profile is reused for at
+        most api.ws_revalidate seconds, so logouts and expiries elsewhere take effect.
+        """
+        session_id, aes_key, _ = await self.session_key(cookie)
+        if aes_key is None:
+            await websocket.close(1008, "invalid_session")
+            return
+        await websocket.accept()
+
+        aesgcm = self.cipher(aes_key)
+        loop = asyncio.get_running_loop()
+        state = {"user": None, "since": loop.time()}
+        send_lock = asyncio.Lock()
+        pending = set()
+
+        async def run(message):
+            call_id = message.get("id") if isinstance(message, dict) else None
+            try:
+                api_name = message.get("api")
+                if api_name not in ("data", "batch"):
+                    resp_data, resp_code = await self.handle_raw(api_name, message.get("data", {}), session_id=session_id)
+                    state["user"] = None  # login state may have changed
+                else:
+                    if state["user"] is None or loop.time() - state["since"] >= self.ws_revalidate:
+                        state["user"] = self.dataapi.get_user(session_id=session_id)
+                        state["since"] = loop.time()
+                    resp_data, resp_code = await self.handle_raw(api_name, message.get("data", {}), session_id=session_id, user=state["user"])
+            except Exception as e:
+                # the client is waiting on this id, it must get an answer
+                print("WebSocket call error:", e)
+                resp_data, resp_code = {"status": "error", "message": str(e)}, 500
+
+            reply = {"id": call_id, "code": resp_code, "data": resp_data}
+            async with send_lock:
+                await websocket.send(aes_seal(aesgcm, json.dumps(reply).encode()))
+
+        try:
+            while True:
+                frame = await websocket.receive()
+                if isinstance(frame, str):
+                    frame = frame.encode()
+                try:
+                    message = json.loads(aes_open(aesgcm, frame))
+                except InvalidTag:
+                    # re-keyed by another worker (or a handshake elsewhere): continue with the stored key
+                    if (fresh := await self.reload_key(session_id, aes_key)) is None:
+                        await websocket.close(1008, "invalid_session")
+                        return
+                    try:
+                        message = json.loads(aes_open(self.cipher(fresh), frame))
+                    except (InvalidTag, ValueError):
+                        await websocket.close(1008, "invalid_session")
+                        return
+                    aes_key, aesgcm = fresh, self.cipher(fresh)
+                except ValueError:
+                    await websocket.close(1008, "bad_frame")
+                    return
+
+                # logged out, expired or deleted since the socket opened
+                _, current_key, _ = await self.session_key(cookie)
+                if current_key != aes_key:
+                    await websocket.close(1008, "invalid_session")
+                    return
+                task = asyncio.create_task(run(message))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def handle_raw(self, api_name, data, session_id=None, user_id=None, user=None):
         if api_name == "auth":
             resp_data = await self.auth.handle(data, session_id)
         elif api_name == "data":
-            resp_data = await self.dataapi.handle(data, session_id=session_id, user_id=user_id)
+            resp_data = await self.dataapi.handle(data, session_id=session_id, user_id=user_id, user=user)
             print("Data API response:", resp_data)
+        elif api_name == "batch":
+            resp_data = await self.dataapi.handle_batch(data, session_id=session_id, user_id=user_id, user=user)
         else:
             return {"error": "unknown_api"}, 404
         print(resp_data)
@@ -1,15 +1,64 @@
+import asyncio
+import threading
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 
-def hash_password(plain_password: str) -> str:
-    return bcrypt.hashpw(plain_password.encode(), bcrypt.gensalt()).decode()
+def hash_password(plain_password: str, rounds: int = 12) -> str:
+    return bcrypt.hashpw(plain_password.encode(), bcrypt.gensalt(rounds)).decode()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+
+def password_cost(hashed_password: str):
+    """Cost factor of a bcrypt hash ("$2b$<cost>$..."), None if unparsable."""
+    try:
+        return int(hashed_password.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+class HashQueueFull(Exception):
+    pass
+
 class NebuloidAuth:
     def __init__(self, services):
         services.inject_services(self)
 
+        self.executor = None
+        self.hash_rounds = 12
+        self.hash_queue_limit = 64
+        self._hash_pending = 0
+        self._hash_lock = threading.Lock()
+
+    def mount(self):
+        auth_conf = self.manifest.data.get('auth', {})
+        self.hash_rounds = auth_conf.get('bcrypt_rounds', 12)
+        self.hash_queue_limit = auth_conf.get('hash_queue_limit', 64)
+        # bcrypt releases the GIL, so a thread pool keeps hashing off the event loop
+        self.executor = ThreadPoolExecutor(
+            max_workers=auth_conf.get('hash_workers', 4),
+            thread_name_prefix="nebuloid-bcrypt"
+        )
+
+    async def run_hash(self, func, *args):
+        """Run a bcrypt call in the hash pool, refusing work beyond the queue limit."""
+        with self._hash_lock:
+            if self._hash_pending >= self.hash_queue_limit:
+                raise HashQueueFull()
+            self._hash_pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            with self._hash_lock:
+                self._hash_pending -= 1
+
     async def handle(self, data, session_id) -> dict:
+        try:
+            return await self._handle(data, session_id)
+        except HashQueueFull:
+            return {"status": "error", "message": "Server busy, please try again."}
+
+    async def _handle(self, data, session_id) -> dict:
         # Ensure data is a dict
         if isinstance(data, str):
             import json
@@ -30,10 +79,17 @@ class NebuloidAuth:
                 return {"status": "error", "message": "Username and password required."}
 
             user = await self.orm.get_user_by_username(username)
-            if not user or not verify_password(password, user.password_hash):
+            if not user or not await self.run_hash(verify_password, password, user.password_hash):
                 return {"status": "error", "message": "Invalid username or password."}
+
+            if password_cost(user.password_hash) != self.hash_rounds:
+                # cost factor changed in the manifest, upgrade the stored hash
+                new_hash = await self.run_hash(hash_password, password, self.hash_rounds)
+                await self.orm.update_user_password(user.id, new_hash)
             
-            await self.orm.update_user_login_status(session_id, user.id, True)
+            if not await self.orm.update_user_login_status(session_id, user.id, True):
+                # unknown session, or a ticket session revoked by a logout: handshake again
+                return {"status": "error", "message": "Session expired, please reconnect."}
 
 
             # Generate token (simple example)ss
@@ -50,7 +106,7 @@ class NebuloidAuth:
             if existing_user:
                 return {"status": "error", "message": "Username already exists."}
 
-            hashed_password = hash_password(password)
+            hashed_password = await self.run_hash(hash_password, password, self.hash_rounds)
             await self.orm.add_user(username, hashed_password)
             return {"status": "success", "message": "User registered successfully."}
         elif data.get("info") == "logout":
@@ -1,26 +1,133 @@
 import asyncio
 from pathlib import Path
 
+def skip_user(func):
+    """Mark a portal function or hook handler that never reads ctx.user, so no profile is loaded for it.
+
+    await ctx.get_user() still resolves the user on demand.
+    """
+    func.nebuloid_skip_user = True
+    return func
+
+_UNRESOLVED = object()
+
+class NebuloidUserLoader:
+    """Resolves session -> user -> profile at most once, shared by everything in a request."""
+    def __init__(self, orm, session_id=None, user_id=None, role=_UNRESOLVED):
+        self.orm = orm
+        self.session_id = session_id
+        self.user_id = user_id
+        self._task = None
+        self._role = role  # role name, when the caller already read it (catch_all's access check)
+
+    async def get_role(self):
+        """The user's role name (None for guests), queried at most once per request."""
+        if self._role is _UNRESOLVED:
+            self._role = await self.orm.get_role(self.user_id)
+        return self._role
+
+    @property
+    def loaded(self):
+        return self._task is not None and self._task.done()
+
+    async def _load(self):
+        if self.user_id is not None:
+            return await self.orm.get_user_profile(user_id=self.user_id)
+        if self.session_id:
+            return await self.orm.get_user_profile(session_id=self.session_id)
+        return {"status": "error", "message": "No session_id or user_id provided"}
+
+    async def response(self):
+        """The full get_user_profile() response."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._load())
+        return await self._task
+
+    async def get(self):
+        """The user's profile row, None when there is no user."""
+        if self.user_id is None and not self.session_id:
+            return None
+        resp = await self.response()
+        return (resp.get("data") or [{}])[0]
+
+    @property
+    def value(self):
+        if self.user_id is None and not self.session_id:
+            return None
+        if not self.loaded:
+            return None
+        return (self._task.result().get("data") or [{}])[0]
+
 class NebuloidContext:
-    def __init__(self, services, args=None, kwargs=None):
-        services.inject_services(self)
+    """What hooks, portal functions and plugin mounts receive.
+
+    Slots only: plugins can no longer set attributes of their own on a context
+    (AttributeError), keep such state on the plugin module instead. A __dict__
+    slot would bring that back at one more allocation per context, measured by
+    benchmarks/context_alloc.py.
+    """
+    # per-call state only; orm, manifest, builder... are read from the shared services, see __getattr__
+    __slots__ = ("services", "args", "kwargs", "_loader", "_user", "_guest", "plugin_name")
+
+    def __init__(self, services, args=None, kwargs=None, user=None, guest=None):
+        self.services = services
         self.args = args
         self.kwargs = kwargs
-        self.user = None  # To be set later if needed
+
+        # user is either a profile dict or a NebuloidUserLoader, loaded by prepare()
+        self._loader = user if isinstance(user, NebuloidUserLoader) else None
+        self._user = None if self._loader else user
+        self._guest = guest  # ctx.user when the loader finds no user (portal functions get {})
 
         self.plugin_name = None
 
+    def __getattr__(self, name):
+        # only reached for names that aren't slots, methods or properties
+        if name != "services" and (service := self.services.get(name)) is not None:
+            return service
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    @property
+    def user(self):
+        if self._user is None and self._loader is not None:
+            value = self._loader.value
+            return self._guest if value is None else value
+        return self._user
+
+    @user.setter
+    def user(self, value):
+        self._user = value
+        self._loader = None
+
+    async def get_user(self):
+        if self._user is None and self._loader is not None:
+            value = await self._loader.get()
+            return self._guest if value is None else value
+        return self._user
+
+    async def prepare(self, func):
+        """Resolve the user before calling func, unless it was marked with skip_user()."""
+        if self._loader is not None and not self._loader.loaded and not getattr(func, "nebuloid_skip_user", False):
+            await self._loader.get()
+
     @property
     def meta(self):
         return {"plugin": self.plugin_name or "Unknown"}
     
-    def register_hook(self, name, func):
-        registry = self.manifest.plugin_registry.setdefault(name, [])
-        if func not in registry:
-            registry.append(func)
-        else:
-            raise ValueError(f"Function {func} already registered for hook {name}")
+    def register_hook(self, name, func, priority=0, timeout=None):
+        """Higher priorities run first; a handler past its timeout (seconds) yields None.
+
+        With a timeout, sync handlers run in a worker thread.
+        """
+        self.plugins.register_hook(name, func, priority=priority, timeout=timeout, plugin=self.plugin_name)
     
+    def invalidate_source(self, name=None, role=None, user_id=None):
+        """Drop cached results of a recipe source, e.g. after a plugin changed the data behind it."""
+        self.builder.invalidate_source(name, role=role, user_id=user_id)
+
+    def invalidate_pages(self, route_name=None):
+        self.builder.invalidate_pages(route_name)
+
     async def sleep(self, seconds):
         await asyncio.sleep(seconds)
 
@@ -49,6 +156,13 @@ class NebuloidContext:
         else:
             raise ValueError(f"Invalid link_type '{link_type}'. Use 'view', 'download', or 'both'.")
     
+    def register_util(self, name, path):
+        """Serve a plugin file under /utils_<name>; relative paths are resolved against the plugin."""
+        path = Path(path)
+        if not path.is_absolute():
+            path = self.get_path(path)
+        self.builder.register_util(name, str(path))
+
     def assets_path(self, relative_path=None):
         base_path = Path('shared/plugins')
         if relative_path is None:
@@ -1,36 +1,98 @@
 import json
+import asyncio
 import inspect
 
-from .context import NebuloidContext
+from .context import NebuloidContext, NebuloidUserLoader
 class NebuloidDataAPI:
     def __init__(self, services):
         services.inject_services(self)
+
+    def get_user(self, session_id=None, user_id=None):
+        """User for portal calls, loaded once before the first function that doesn't skip_user()."""
+        return NebuloidUserLoader(self.orm, session_id=session_id, user_id=user_id)
+
+    async def call(self, name, args, user):
+        if name not in self.manifest.func_registry['portal']:
+            return {"status": "error", "message": f"Unknown portal function '{name}'."}
+
+        func = self.manifest.func_registry['portal'][name]
+        context = NebuloidContext(self.services, args, user=user, guest={})
+        try:
+            await context.prepare(func)
+            result = func(context)
+            if inspect.isawaitable(result):
+                result = await result
+            elif inspect.isasyncgen(result):
+                result = [chunk async for chunk in result]
+            elif inspect.isgenerator(result):
+                result = list(result)
+        except Exception as e:
+            print("Error executing function:", e)
+            return {"status": "error", "message": str(e)}
+        print("Function result:", result)
+        return {"status": "success", "result": result}
     
-    async def handle(self, data, session_id=None, user_id=None) -> dict:
+    async def handle(self, data, session_id=None, user_id=None, user=None) -> dict:
         if isinstance(data, str):
             data = json.loads(data)
         print("Data API called with data:", data, "Session ID:", session_id)
 
-        # Example: simple "add" operation
-        print("Available functions:", self.manifest.func_registry['portal'].keys())
         if data.get("name") in self.manifest.func_registry['portal'].keys():
-            print("data", data.get("args", {}))
-            context = NebuloidContext(self.services, data.get("args", {}))
-            if session_id:
-                resp = await self.orm.get_user_profile(session_id=session_id)
-            elif user_id:
-                resp = await self.orm.get_user_profile(user_id=user_id)
+            if user is None:
+                user = self.get_user(session_id=session_id, user_id=user_id)
+            return await self.call(data.get("name"), data.get("args", {}), user)
+        return {"status": "error", "message": "Data API not implemented yet."}
+
+    async def handle_batch(self, data, session_id=None, user_id=None, user=None) -> dict:
+        """Run several portal calls ({"calls": [{name, args}, ...]}) concurrently for one user."""
+        if isinstance(data, str):
+            data = json.loads(data)
+
+        calls = data.get("calls") or []
+        max_batch = self.manifest.data.get("api", {}).get("max_batch", 64)
+        if not isinstance(calls, list) or len(calls) > max_batch:
+            return {"status": "error", "message": f"A batch takes a list of at most {max_batch} calls."}
+
+        if user is None:
+            user = self.get_user(session_id=session_id, user_id=user_id)
+        results = await asyncio.gather(*(
+            self.call(call.get("name"), call.get("args", {}), user) if isinstance(call, dict)
+            else self.invalid_call(call) for call in calls
+        ))
+        return {"status": "success", "results": results}
+
+    async def invalid_call(self, call):
+        return {"status": "error", "message": f"A batch call must be an object with a name, got {type(call).__name__}."}
+
+    async def stream(self, data, session_id=None, user_id=None, user=None):
+        """Yield a portal function's output chunk by chunk, ending with a "done" (or error) message."""
+        if isinstance(data, str):
+            data = json.loads(data)
+
+        name = data.get("name")
+        if name not in self.manifest.func_registry['portal']:
+            yield {"status": "error", "message": f"Unknown portal function '{name}'."}
+            return
+
+        func = self.manifest.func_registry['portal'][name]
+        if user is None:
+            user = self.get_user(session_id=session_id, user_id=user_id)
+        context = NebuloidContext(self.services, data.get("args", {}), user=user, guest={})
+        try:
+            await context.prepare(func)
+            result = func(context)
+            if inspect.isasyncgen(result):
+                async for chunk in result:
+                    yield {"chunk": chunk}
+            elif inspect.isgenerator(result):
+                for chunk in result:
+                    yield {"chunk": chunk}
             else:
-                resp = {"status": "error", "message": "No session_id or user_id provided"}
-            print("User profile response:", resp)
-            context.user = resp.get("data", [{}])[0]
-            try:
-                result = self.manifest.func_registry['portal'][data.get("name")](context)
                 if inspect.isawaitable(result):
                     result = await result
-            except Exception as e:
-                print("Error executing function:", e)
-                return {"status": "error", "message": str(e)}
-            print("Function result:", result)
-            return {"status": "success", "result": result}
-        return {"status": "error", "message": "Data API not implemented yet."}
\ No newline at end of file
+                yield {"chunk": result}
+        except Exception as e:
+            print("Error streaming function:", e)
+            yield {"status": "error", "message": str(e)}
+            return
+        yield {"status": "done"}
@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+# '/utils_<name>' string literals, as used by the modules' import statements
+UTILS_URL = re.compile(r"""(['"])/utils_([\w.-]+)\1""")
+# text assets worth precompressing: written as .gz/.br at build time, kept compressed in NebuloidAssetCache
+COMPRESSIBLE = (".js", ".mjs", ".css", ".svg", ".json", ".txt", ".html", ".xml")
+
+# a `/` after one of these starts a regex literal rather than a division
+REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "yield", "await", "instanceof"}
+LITERALS = ("'", '"', "`")
+
+def js_line_states(text):
+    """For each line of text: (state at its start, state at its end, whether it has code).
+
+    A state is None (code), "/*" (block comment) or the quote of the string or
+    template literal the position is in. Strings, template literals with nested
+    ${...}, comments and regex literals are followed, so a quote, backtick or
+    slash inside any of them is not mistaken for a delimiter. Returns None when
+    the text can't be followed (a literal left open at a line break or at the
+    end), in which case it is best left as it is.
+    """
+    lines = []
+    stack = []  # "{" for a brace, "`" for the template literal a ${ returns to
+    state, escaped, regex_ok, word = None, False, True, ""
+    line_start, has_code = None, False
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        i += 1
+        if word and not (c.isalnum() or c in "_$"):
+            regex_ok, word = word in REGEX_KEYWORDS, ""
+
+        if c == "\n":
+            if state == "//":
+                state = None
+            elif state in ("re", "re[") or (state in ("'", '"') and not escaped):
+                return None
+            lines.append((line_start, state, has_code))
+            line_start, has_code, escaped = state, False, False
+            continue
+        if escaped:
+            escaped = False
+            continue
+
+        if state == "//":
+            continue
+        if state == "/*":
+            if c == "*" and text.startswith("/", i):
+                state, i = None, i + 1
+            continue
+        if state is not None:
+            has_code = True
+            if c == "\\":
+                escaped = True
+            elif state in ("'", '"', "`") and c == state:
+                state, regex_ok = None, False
+            elif state == "`" and c == "$" and text.startswith("{", i):
+                stack.append("`")
+                state, regex_ok, i = None, True, i + 1
+            elif state == "re" and c == "/":
+                state, regex_ok = None, False
+            elif state == "re" and c == "[":
+                state = "re["
+            elif state == "re[" and c == "]":
+                state = "re"
+            continue
+
+        if c.isspace():
+            continue
+        if c == "/" and text.startswith(("/", "*"), i):
+            state, i = "/" + text[i], i + 1
+            continue
+        has_code = True
+        if c.isalnum() or c in "_$":
+            word, regex_ok = word + c, False
+        elif c in LITERALS:
+            state = c
+        elif c == "/":
+            state = "re" if regex_ok else None
+            regex_ok = True
+        elif c == "{":
+            stack.append("{")
+            regex_ok = True
+        elif c == "}":
+            if stack and stack.pop() == "`":
+                state = "`"
+            regex_ok = True
+        else:
+            regex_ok = c not in ")]"
+
+    if state not in (None, "//") or "`" in stack:
+        return None
+    lines.append((line_start, state, has_code))
+    return lines
+
+def minify_js(text):
+    """Conservative minification: drop indentation, blank lines and whole-line comments.
+
+    Line breaks are kept so automatic semicolon insertion is unaffected, and
+    whatever is inside a string or template literal is left untouched. Text
+    js_line_states can't follow is returned as it is.
+    """
+    text = text.replace("\r\n", "\n")
+    if (states := js_line_states(text)) is None:
+        return text
+    out = []
+    for line, (start, end, has_code) in zip(text.split("\n"), states):
+        if start not in LITERALS:
+            if not has_code:
+                continue
+            line = line.lstrip()
+        if end != "`":
+            line = line.rstrip()
+        out.append(line)
+    return "\n".join(out) + "\n"
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def hashed_name(name, data):
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{content_hash(data)}{ext}"
+
+class NebuloidAssets:
+    """Minified, content-hashed builds of the utils modules, plus per-route static fingerprints."""
+    def __init__(self):
+        self.urls = {}    # "tools.js" -> "/utils_tools.<hash>.js"
+        self.files = {}   # "tools.<hash>.js" -> (path, encodings available next to it)
+        self.static_hashes = {}  # path -> (mtime, hash)
+
+    def build_utils(self, sources, out_dir):
+        """Build every module in sources (name -> path) into out_dir.
+
+        Imports between them are rewritten to hashed URLs first, so a module's
+        hash also changes when one of its imports does.
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        built = {}  # name -> hashed name
+
+        def build(name, trail=()):
+            if name in built:
+                return built[name]
+            if name in trail:
+                return None  # import cycle: that import keeps its plain URL
+
+            with open(sources[name], "r", encoding="utf-8") as f:
+                text = f.read()
+
+            def rewrite(match):
+                quote, dep = match.groups()
+                if dep in sources and (dep_hashed := build(dep, trail + (name,))):
+                    return f"{quote}/utils_{dep_hashed}{quote}"
+                return match.group(0)
+
+            text = UTILS_URL.sub(rewrite, text)
+            if name.endswith((".js", ".mjs")):
+                text = minify_js(text)
+            data = text.encode("utf-8")
+
+            hashed = hashed_name(name, data)
+            path = os.path.join(out_dir, hashed)
+            if not os.path.exists(path):
+                self.write_variants(path, data)
+            built[name] = hashed
+            return hashed
+
+        files = {}
+        for name in sources:
+            hashed = build(name)
+            path = os.path.join(out_dir, hashed)
+            encodings = [enc for enc, ext in (("br", ".br"), ("gzip", ".gz")) if os.path.exists(path + ext)]
+            files[hashed] = (path, tuple(encodings))
+
+        # builds of older contents are unreachable now
+        keep = {os.path.basename(path) + ext for path, _ in files.values() for ext in ("", ".gz", ".br")}
+        for file_name in os.listdir(out_dir):
+            if file_name not in keep:
+                os.remove(os.path.join(out_dir, file_name))
+
+        self.files = files
+        self.urls = {name: f"/utils_{hashed}" for name, hashed in built.items()}
+
+    def write_variants(self, path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+        if path.endswith(COMPRESSIBLE):
+            with open(path + ".gz", "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(path + ".br", "wb") as f:
+                    f.write(brotli.compress(data))
+
+    def utils_url(self, name):
+        return self.urls.get(name, f"/utils_{name}")
+
+    def static_hash(self, path):
+        """Content hash of a static file, recomputed only when its mtime changes."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        entry = self.static_hashes.get(path)
+        if entry is None or entry[0] != mtime:
+            with open(path, "rb") as f:
+                entry = (mtime, content_hash(f.read()))
+            self.static_hashes[path] = entry
+        return entry[1]
+
+    def static_url(self, base_dir, route_name, name):
+        url = f"/static_{route_name}/{name}"
+        digest = self.static_hash(os.path.join(base_dir, route_name, "static", name))
+        return f"{url}?v={digest}" if digest else url
@@ -1,41 +1,212 @@
-import os, yaml
-import requests
+import os
+import re
+import asyncio
+from typing import NamedTuple, Optional
 import importlib.resources as pkg_resources
-from jinja2 import Environment, FileSystemLoader, select_autoescape, Template
+from pathlib import Path
+from urllib.parse import quote
+from nebuloid.api.context import NebuloidUserLoader
+import jinja2
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape, meta, Template
+
+from .plan import NebuloidPagePlan, compile_plan, plan_mtime
+from .http import NebuloidHTTPClient
+from .lazy import NebuloidLazyData
+from .assets import NebuloidAssets
+from .source_cache import NebuloidSourceCache
+from .page_cache import NebuloidCacheExtension, cache_bypass, fingerprint
+from nebuloid.core.cache import NebuloidCache
+from nebuloid.manifest.manifest import thaw
+
+class PageRender(NamedTuple):
+    plan: NebuloidPagePlan
+    template: Template
+    variables: dict
+    bypass: bool
+    cache_key: Optional[tuple]
+    ttl: Optional[int]
+    cached: Optional[str]  # page served from the page cache
+
+def walk_files(root, prefix=""):
+    """(relative name, path) of every file below a directory or package Traversable."""
+    for entry in root.iterdir():
+        if entry.is_dir():
+            yield from walk_files(entry, f"{prefix}{entry.name}/")
+        elif entry.is_file():
+            yield prefix + entry.name, str(entry)
+
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+def fill_params(value, params):
+    """Replace `{name}` placeholders with route parameters in strings, lists and dicts.
+
+    A string that is a single placeholder takes the parameter's own value, keeping e.g. ints.
+    Always returns plain containers, never the frozen plan data it was given.
+    """
+    if not params:
+        return thaw(value)
+    if isinstance(value, str):
+        whole = PLACEHOLDER.fullmatch(value)
+        if whole and whole.group(1) in params:
+            return params[whole.group(1)]
+        return PLACEHOLDER.sub(lambda m: str(params[m.group(1)]) if m.group(1) in params else m.group(0), value)
+    if isinstance(value, (list, tuple)):
+        return [fill_params(item, params) for item in value]
+    if hasattr(value, "items"):
+        return {key: fill_params(item, params) for key, item in value.items()}
+    return value
+
+def as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+def dependency_errors(sources):
+    """Error results for sources whose depends_on names an unknown source or forms a cycle."""
+    deps = {source["name"]: as_list(source.get("depends_on")) for source in sources}
+    errors = {}
+    state = {}  # name -> "visiting" | "done"
+
+    def visit(name):
+        if state.get(name) == "done":
+            return name not in errors
+        if state.get(name) == "visiting":
+            errors[name] = {"status": "error", "message": f"Dependency cycle through '{name}'"}
+            return False
+        state[name] = "visiting"
+        ok = True
+        for dep in deps[name]:
+            if dep not in deps:
+                errors[name] = {"status": "error", "message": f"Unknown dependency '{dep}'"}
+                ok = False
+            elif not visit(dep):
+                errors.setdefault(name, {"status": "error", "message": f"Dependency '{dep}' unavailable"})
+                ok = False
+        state[name] = "done"
+        return ok
+
+    for name in deps:
+        visit(name)
+    return errors
 
 class NebuloidBuilder:
     def __init__(self, services, base_dir="pages"):
         services.inject_services(self)
 
         self.base_dir = base_dir
+        self.plans = {}  # route_name -> NebuloidPagePlan
+        self.recipe_reload = "mtime"
+        self.http = NebuloidHTTPClient()
+        self.assets = NebuloidAssets()
+        self.utils_index = {}   # name under /utils_ -> file path
+        self.plugin_utils = {}  # name -> path, from ctx.register_util()
+        self.source_cache = NebuloidSourceCache(self.orm)
+        self.page_cache = NebuloidCache(max_bytes=32 * 1024 * 1024)
 
         # Jinja environment (supports extends/includes)
         self.env = Environment(
             loader=FileSystemLoader([self.base_dir,"shared"]),
-            autoescape=select_autoescape(["html", "jinja"])
+            autoescape=select_autoescape(["html", "jinja"]),
+            extensions=[NebuloidCacheExtension],
+            enable_async=True  # awaits lazy `datas` reads, see NebuloidLazyData
+        )
+        self.env.fragment_cache = NebuloidCache(max_bytes=8 * 1024 * 1024)
+
+    def mount(self):
+        # "mtime": recipes are re-checked on every build, "manual": only through reload_plans()
+        self.recipe_reload = self.manifest.data.get('server', {}).get('recipe_reload', "mtime")
+
+        http_conf = self.manifest.data.get('http', {})
+        self.http = NebuloidHTTPClient(
+            max_connections=http_conf.get('max_connections', 100),
+            max_keepalive=http_conf.get('max_keepalive', 20),
+            per_host=http_conf.get('per_host', 10),
+            cache_entries=http_conf.get('cache_entries', 256),
+            timeout=http_conf.get('timeout', 10)
         )
 
-    async def build(self, route_name: str, user_id) -> str:
-        recipe_file = os.path.join(self.base_dir, route_name, "recipe.yaml")
-        if not os.path.exists(recipe_file):
-            raise FileNotFoundError(f"Recipe not found for route '{route_name}'")
+        cache_conf = self.manifest.data.get('cache', {})
+        page_conf = cache_conf.get('pages', {})
+        self.page_cache = NebuloidCache(
+            max_entries=page_conf.get('max_entries', 1024),
+            max_bytes=page_conf.get('max_bytes', 32 * 1024 * 1024)
+        )
+        fragment_conf = cache_conf.get('fragments', {})
+        self.env.fragment_cache = NebuloidCache(
+            max_entries=fragment_conf.get('max_entries', 4096),
+            max_bytes=fragment_conf.get('max_bytes', 8 * 1024 * 1024),
+            ttl=fragment_conf.get('ttl', 300)
+        )
 
-        with open(recipe_file, "r") as f:
-            recipe_data = yaml.safe_load(f) or {}
+        # warm the plan cache for every manifest route
+        self.plans = {}
+        route_names = {"404"}
+        for routes in self.manifest.data['server']['routes'].values():
+            route_names.update([routes] if isinstance(routes, str) else routes)
+        for route_name in route_names:
+            try:
+                self.get_plan(route_name)
+            except (FileNotFoundError, ValueError) as e:
+                print(f"Recipe for '{route_name}' not compiled: {e}")
 
-        page_data = recipe_data.get("page", {})
-        template_name = page_data.get("template")
-        meta_data = recipe_data.get("data")
-        
-        datas = await self.get_data(meta_data['sources'], user_id) if meta_data else {}
+        # bytecode depends on the Jinja version and on async mode, keep it apart per combination
+        self.env.bytecode_cache = FileSystemBytecodeCache(
+            str(self.storage.dir('bytecode')),
+            pattern=f"__jinja2_{jinja2.__version__}_async_%s.cache"
+        )
+        self.precompile()
 
-        print("data fetched:", datas)
+    def get_plan(self, route_name):
+        plan = self.plans.get(route_name)
+        if plan is None or (self.recipe_reload == "mtime" and plan.mtime != plan_mtime(self.base_dir, route_name)):
+            plan = compile_plan(self.base_dir, route_name)
+            self.source_cache.register(route_name, plan.sources)
+            self.plans[route_name] = plan
+        return plan
 
-        if not template_name:
-            raise ValueError(f"⚠ No template defined in recipe for '{route_name}'")
+    def precompile(self):
+        """Compile route templates and everything they extend, include or import, so the first request doesn't."""
+        pending = [plan.template_path for plan in self.plans.values()]
+        seen = set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            try:
+                source, _, _ = self.env.loader.get_source(self.env, name)
+                self.env.get_template(name)
+                # None for names computed at render time
+                pending.extend(ref for ref in meta.find_referenced_templates(self.env.parse(source)) if ref)
+            except Exception as e:
+                print(f"Template '{name}' not precompiled: {e}")
 
-        # Ensure clean relative path
-        template_path = os.path.normpath(os.path.join(route_name, template_name)).replace("\\", "/")
+    def reload_plans(self, route_name=None):
+        """Drop compiled recipes (all, or one route) so they are recompiled on next use."""
+        if route_name is None:
+            self.plans = {}
+        else:
+            self.plans.pop(route_name, None)
+
+    async def prepare(self, route_name, user_id, user=None, params=None, plan=None) -> PageRender:
+        """Everything up to rendering: data, template, render_page hooks and the page cache lookup.
+
+        plan: the route's plan when the caller already resolved it, which saves the freshness check.
+        """
+        if user is None:
+            user = NebuloidUserLoader(self.orm, user_id=user_id)
+
+        plan = plan or self.get_plan(route_name)
+        template_path = plan.template_path
+
+        if plan.sources is None:
+            datas = {}
+        elif plan.lazy:
+            datas = await self.lazy_data(plan.sources, user_id, user, params)
+        else:
+            datas = await self.get_data(plan.sources, user_id, user, params)
+
+        print("data fetched:", datas)
 
         try:
             template = self.env.get_template(template_path)
@@ -46,70 +217,221 @@ class NebuloidBuilder:
                 f"Search paths: {self.env.loader.searchpath if hasattr(self.env.loader, 'searchpath') else 'unknown'}"
             ) from e
 
-        # Just render the template (static for now)
-        hook_results = await self.plugins.hook("render_page", user_id=user_id, datas=datas, route_name=route_name, template=template)
+        hook_results = await self.plugins.hook("render_page", user_id=user_id, user=user, datas=datas, route_name=route_name, template=template)
         for result in hook_results:
             if isinstance(result, dict):
                 datas.update(result) 
-        return template.render(
-            datas=datas,
-            utils=lambda x: ('/utils_'+x),
-            static=lambda x: (f'/static_{route_name}/'+x)
-        )
-    
-    async def get_data(self, sources, user_id):
+
+        # "logged_in": pages of logged-in users are personal, skip page and fragment caches for them
+        bypass = plan.cache.get("bypass") == "always" or (plan.cache.get("bypass") == "logged_in" and user_id is not None)
+        page_ttl = plan.cache.get("ttl")
+
+        # lazy data is only known once rendered, so there is nothing to key the page on
+        cache_key, cached = None, None
+        if page_ttl and not bypass and not plan.lazy:
+            cache_key = (route_name, await user.get_role(), fingerprint([params, datas]))
+            entry = self.page_cache.get(cache_key)
+            # a template edited since the entry was stored is a new Template object
+            if entry is not None and entry[0] is template:
+                cached = entry[1]
+
+        variables = {
+            "datas": datas,
+            "params": params or {},
+            "utils": self.assets.utils_url,
+            "static": lambda x: self.assets.static_url(self.base_dir, route_name, x)
+        }
+        return PageRender(plan, template, variables, bypass, cache_key, page_ttl, cached)
+
+    async def build(self, route_name: str, user_id, user=None, params=None, plan=None) -> str:
+        page = await self.prepare(route_name, user_id, user, params, plan)
+        if page.cached is not None:
+            return page.cached
+
+        token = cache_bypass.set(page.bypass)
+        try:
+            html = await page.template.render_async(page.variables)
+        finally:
+            cache_bypass.reset(token)
+
+        if page.cache_key is not None:
+            self.page_cache.set(page.cache_key, (page.template, html), ttl=page.ttl, size=len(html))
+        return html
+
+    def streams(self, route_name):
+        """Whether the recipe opted into streamed rendering (page.stream)."""
+        return bool(self.get_plan(route_name).page.get("stream"))
+
+    async def build_stream(self, route_name: str, user_id, user=None, params=None, plan=None):
+        """Like build(), but returns an async iterator of HTML chunks.
+
+        Under Quart the first chunk is rendered before returning, so errors up to that
+        point raise here like they do in build() and the caller can still pick a status.
+        """
+        page = await self.prepare(route_name, user_id, user, params, plan)
+        if page.cached is not None:
+            async def cached_page():
+                yield page.cached
+            return cached_page()
+
+        buffer_size = page.plan.page.get("stream_buffer", 4096)
+        events = page.template.generate_async(page.variables)
+
+        async def next_chunk():
+            # flush once the buffer is full, or right after </head> so the browser can start on assets
+            parts, size = [], 0
+            token = cache_bypass.set(page.bypass)
+            try:
+                async for event in events:
+                    parts.append(event)
+                    size += len(event)
+                    if size >= buffer_size or "</head>" in event:
+                        break
+            finally:
+                cache_bypass.reset(token)
+            return "".join(parts)
+
+        # Flask closes the view's event loop, and the async generators started on it, before
+        # the body is sent; there the first chunk is rendered while streaming instead
+        first = None if self.use_flask else await next_chunk()
+
+        async def chunks():
+            rendered = []
+            try:
+                chunk = await next_chunk() if first is None else first
+                while chunk:
+                    rendered.append(chunk)
+                    yield chunk
+                    chunk = await next_chunk()
+            except Exception as e:
+                # the status line is already sent, so end the document instead
+                print(f"Render error in '{route_name}' while streaming: {e}")
+                yield "<!-- render error -->"
+                return
+
+            if page.cache_key is not None:
+                html = "".join(rendered)
+                self.page_cache.set(page.cache_key, (page.template, html), ttl=page.ttl, size=len(html))
+
+        return chunks()
+
+    async def source_hook(self, hook_name, sources, **kwargs):
+        """Fire a data hook with a plain copy of the plan's sources, made only when a handler is registered."""
+        if not self.plugins.handlers(hook_name):
+            return []
+        return await self.plugins.hook(hook_name, sources=thaw(sources), **kwargs)
+
+    async def get_data(self, sources, user_id, user=None, params=None):
+        if user is None:
+            user = NebuloidUserLoader(self.orm, user_id=user_id)
+        await self.source_hook("before_get_data", sources, user_id=user_id, user=user)
+
+        # Independent sources run concurrently; `depends_on` orders the rest
+        blocked = dependency_errors(sources)
+        tasks = {}
+
+        for source in sources:
+            if source["name"] not in blocked:
+                tasks[source["name"]] = asyncio.ensure_future(self.run_source(source, user_id, user, tasks.get, params))
+        if tasks:
+            await asyncio.wait(tasks.values())
+
         results = {}
-        await self.plugins.hook("before_get_data", sources=sources, user_id=user_id)
         for source in sources:
-            print("Data source:", source["name"])
-
-            if source.get('type') == 'sql':
-                query = source.get('query')
-                try:
-                    result = await self.orm.execute(query)  # ✅ now valid
-                    results[source["name"]] = result
-                except Exception as e:
-                    results[source["name"]] = {
-                        "status": "error",
-                        "message": str(e)
-                    }
-            elif source.get('type') == 'rest':
-                endpoint = source.get("endpoint")
-                try:
-                    resp = requests.get(endpoint, timeout=10)
-                    resp.raise_for_status()
-                    results[source["name"]] = {
-                        "status": "success",
-                        "data": resp.json()
-                    }
-                except Exception as e:
-                    results[source["name"]] = {
-                        "status": "error",
-                        "message": str(e)
-                    }
-            elif source.get('type') == 'internal':
-                print("Source", source)
-                req_datas = source.get("datas", [])
-                internal_results = {}
-                for req in req_datas:
-                    if req == "profile":
-                        internal_results["profile"] = await self.orm.get_user_profile(user_id)
-                    elif req == "settings":
-                        internal_results["settings"] = await self.orm.execute("SELECT preferences FROM testdb.users where id= :user_id", {"user_id": user_id})
-                results[source["name"]] = internal_results
-            elif source.get('type') == 'portal':
-                api_data, code = await self.api.handle_raw("data", {"name": source.get("portal_name", ""), "args": source.get("args", {})}, user_id=user_id)
-                results[source["name"]] = api_data['result'] if code == 200 else {"status": "error", "message": "Portal API error"}
-            else:
-                results[source["name"]] = {"status": "error", "message": "Unknown source type"}
-        hook_results = await self.plugins.hook("after_get_data", sources=sources, user_id=user_id, results=results)
+            name = source["name"]
+            results[name] = tasks[name].result() if name in tasks else blocked[name]
+
+        hook_results = await self.source_hook("after_get_data", sources, user_id=user_id, user=user, results=results)
         for result in hook_results:
             if isinstance(result, dict):
                 results.update(result) 
         return results
+
+    async def lazy_data(self, sources, user_id, user=None, params=None):
+        """Like get_data(), but nothing is fetched until the template reads a source.
+
+        after_get_data does not fire for lazy pages: results only exist while rendering.
+        """
+        if user is None:
+            user = NebuloidUserLoader(self.orm, user_id=user_id)
+        await self.source_hook("before_get_data", sources, user_id=user_id, user=user)
+
+        async def run(source, dependency):
+            return await self.run_source(source, user_id, user, dependency, params)
+        return NebuloidLazyData(sources, run, dependency_errors(sources))
+
+    async def run_source(self, source, user_id, user, dependency, params=None):
+        """One source with its dependencies, cache and timeout; errors become error results."""
+        for dep in as_list(source.get("depends_on")):
+            await asyncio.wait([dependency(dep)])
+        print("Data source:", source["name"])
+        timeout = source.get("timeout")
+        try:
+            if source.get("cache"):
+                fetch = self.source_cache.get(source, user, lambda: self.fetch_source(source, user_id, user, params), params)
+            else:
+                fetch = self.fetch_source(source, user_id, user, params)
+            return await asyncio.wait_for(fetch, timeout)
+        except asyncio.TimeoutError:
+            return {"status": "error", "message": f"Source timed out after {timeout}s"}
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+    async def fetch_source(self, source, user_id, user, params=None):
+        """One source's data; route parameters bind into sql queries and fill `{name}` in endpoints and portal args."""
+        params = params or {}
+        if source.get('type') == 'sql':
+            query = source.get('query')
+            return await self.orm.execute(query, params)
+        elif source.get('type') == 'rest':
+            endpoint = fill_params(source.get("endpoint"), {name: quote(str(value), safe="") for name, value in params.items()})
+            http_conf = source.get("http", {})
+            data = await self.http.get_json(
+                endpoint,
+                headers=http_conf.get("headers"),
+                timeout=http_conf.get("timeout"),
+                cache=http_conf.get("cache", True),
+                max_per_host=http_conf.get("max_per_host")
+            )
+            return {
+                "status": "success",
+                "data": data
+            }
+        elif source.get('type') == 'internal':
+            print("Source", source)
+            req_datas = source.get("datas", [])
+            internal_results = {}
+            for req in req_datas:
+                if req == "profile":
+                    internal_results["profile"] = await user.response()
+                elif req == "settings":
+                    internal_results["settings"] = await self.orm.execute("SELECT preferences FROM testdb.users where id= :user_id", {"user_id": user_id})
+            return internal_results
+        elif source.get('type') == 'portal':
+            args = fill_params(source.get("args", {}), params)
+            api_data, code = await self.api.handle_raw("data", {"name": source.get("portal_name", ""), "args": args}, user_id=user_id, user=user)
+            if code == 200 and api_data.get("status") == "success":
+                return api_data['result']
+            return {"status": "error", "message": api_data.get("message", "Portal API error")}
+        return {"status": "error", "message": "Unknown source type"}
+
+    def invalidate_source(self, name=None, role=None, user_id=None):
+        """Drop cached source results (see the `cache` option of recipe sources)."""
+        self.source_cache.invalidate(name, role=role, user_id=user_id)
+
+    def invalidate_pages(self, route_name=None):
+        """Drop rendered pages (all, or one route) and every cached fragment."""
+        if route_name is None:
+            self.page_cache.clear()
+        else:
+            for key in self.page_cache.keys():
+                if key[0] == route_name:
+                    self.page_cache.pop(key)
+        self.env.fragment_cache.clear()
+
     async def gen_utils(self, info):
         templates = {
-            "portal.js": ("template/portal.js.jinja", {"func_names": info["args"].get("func_names")}),
+            "portal.js": ("template/portal.js.jinja", {"func_names": info["args"].get("func_names"), "stream_names": info["args"].get("stream_names", []), "websocket": info["args"].get("websocket", False), "max_batch": info["args"].get("max_batch", 64)}),
             "pem.js": ("template/pem.js.jinja", {"key": info["args"].get("key")}),
         }
         await self.plugins.hook("before_gen_util", info=info)
@@ -128,5 +450,52 @@ class NebuloidBuilder:
         output_path = os.path.join(self.storage.dir("utils"), name)
         with open(output_path, "w") as f:
             f.write(output)
+        self.check_util(self.utils_index, name, output_path)
+        self.utils_index[name] = output_path
+
+        self.build_assets()
+
+        await self.plugins.hook("after_gen_util", name=name, output_path=output_path)
+
+    def index_utils(self, shared_dir="shared"):
+        """Map every name served under /utils_ to its file.
+
+        Same precedence as the old per-request lookups: package utils, then the
+        shared dir, then the storage utils dir. Files registered by plugins come
+        last and may not shadow any of those: plugins mount before this runs, so
+        their registrations are checked here and a conflict raises ValueError.
+        """
+        index = {}
+        roots = [pkg_resources.files("nebuloid.utils"), Path(shared_dir), self.storage.dir("utils")]
+        for root in roots:
+            if root.is_dir():
+                for name, path in walk_files(root):
+                    index.setdefault(name, path)
+        for name, path in self.plugin_utils.items():
+            self.check_util(index, name, path)
+            index[name] = path
+        self.utils_index = index
+
+    def check_util(self, index, name, path):
+        current = index.get(name)
+        if current is not None and os.path.abspath(current) != os.path.abspath(path):
+            raise ValueError(f"Utility {name} is already served from {current}")
+
+    def register_util(self, name, path):
+        """Serve a plugin file under /utils_<name>; see index_utils() for what it may not shadow."""
+        self.check_util(self.plugin_utils, name, path)
+        self.check_util(self.utils_index, name, path)  # empty until index_utils() ran
+        self.plugin_utils[name] = path
+        self.utils_index[name] = path
 
-        await self.plugins.hook("after_gen_util", name=name, output_path=output_path)
\ No newline at end of file
+    def build_assets(self):
+        """Rebuild the hashed utils modules: the package's own, then those generated into the utils dir."""
+        sources = {}
+        for entry in pkg_resources.files("nebuloid.utils").iterdir():
+            if entry.is_file() and entry.name.endswith(".js"):
+                sources[entry.name] = str(entry)
+        utils_dir = self.storage.dir("utils")
+        for entry in utils_dir.iterdir():
+            if entry.is_file() and entry.name.endswith(".js"):
+                sources.setdefault(entry.name, str(entry))
+        self.assets.build_utils(sources, str(utils_dir / "dist"))
\ No newline at end of file
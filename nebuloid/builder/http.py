@@ -0,0 +1,115 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from nebuloid.core.cache import NebuloidCache
+
+def cache_lifetime(headers):
+    """Freshness lifetime in seconds from Cache-Control, None when the response must not be stored."""
+    directives = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(int(directives[name]), 0)
+            except ValueError:
+                return 0
+    return 0
+
+async def close_with_loop(client):
+    """Started once per client: the loop's shutdown_asyncgens() (asyncio.run, asgiref) resumes it to close the client."""
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+class NebuloidHTTPClient:
+    """Shared async HTTP client for `rest` data sources.
+
+    Keeps pooled keep-alive connections, limits concurrent requests per host,
+    revalidates with ETag/Last-Modified and keeps a small response cache that
+    honors Cache-Control.
+    """
+    def __init__(self, max_connections=100, max_keepalive=20, per_host=10, cache_entries=256, timeout=10, transport=None):
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.per_host = per_host
+        self.timeout = timeout
+        self.transport = transport
+        self.cache = NebuloidCache(max_entries=cache_entries)
+        self._clients = {}  # event loop -> (AsyncClient, {(host, limit): Semaphore}, closer)
+
+    async def _client(self):
+        # Quart serves everything from one loop; Flask runs each request in a fresh one
+        loop = asyncio.get_running_loop()
+        for old_loop in [l for l in self._clients if l.is_closed()]:
+            # normally closed by its closer already; a loop closed without
+            # shutdown_asyncgens() leaves nothing that could still close it
+            client, _, _ = self._clients.pop(old_loop)
+            if not client.is_closed:
+                print("HTTP client of a closed event loop was not closed")
+
+        if loop not in self._clients:
+            client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout, transport=self.transport)
+            closer = close_with_loop(client)
+            await closer.__anext__()  # registers it with the loop's async generator hooks
+            self._clients[loop] = (client, {}, closer)
+        return self._clients[loop]
+
+    async def get_json(self, url, headers=None, timeout=None, cache=True, max_per_host=None):
+        headers = dict(headers or {})
+        key = (url, tuple(sorted(headers.items())))
+        entry = self.cache.get(key) if cache else None
+
+        if entry is not None and entry["expires"] > time.monotonic():
+            return entry["data"]
+
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        client, host_limits, _ = await self._client()
+        # sources may set their own per-host limit, each limit gets its own semaphore
+        limit = (urlsplit(url).netloc, max_per_host or self.per_host)
+        if limit not in host_limits:
+            host_limits[limit] = asyncio.Semaphore(limit[1])
+
+        async with host_limits[limit]:
+            resp = await client.get(url, headers=headers, timeout=timeout or self.timeout)
+
+        if resp.status_code == 304 and entry is not None:
+            lifetime = cache_lifetime(resp.headers)
+            if lifetime is not None:
+                self.cache.set(key, {**entry, "expires": time.monotonic() + lifetime})
+            return entry["data"]
+
+        resp.raise_for_status()
+        data = resp.json()
+
+        lifetime = cache_lifetime(resp.headers)
+        etag = resp.headers.get("etag")
+        last_modified = resp.headers.get("last-modified")
+        if cache and lifetime is not None and (lifetime > 0 or etag or last_modified):
+            self.cache.set(key, {
+                "data": data,
+                "etag": etag,
+                "last_modified": last_modified,
+                "expires": time.monotonic() + lifetime,
+            })
+        return data
+
+    async def aclose(self):
+        for _, _, closer in self._clients.values():
+            await closer.aclose()
+        self._clients = {}
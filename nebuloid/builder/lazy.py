@@ -0,0 +1,53 @@
+import asyncio
+from collections.abc import MutableMapping
+
+class NebuloidLazyData(MutableMapping):
+    """`datas` of a recipe with `data: {lazy: true}`: each source is fetched the first time the template reads it.
+
+    Reading a source that isn't resolved yet returns a Future, which the async
+    Jinja environment awaits; the fetch is shared by every later read.
+    """
+    def __init__(self, sources, run, resolved=None):
+        self._sources = {source["name"]: source for source in sources}
+        self._run = run  # async (source, dependency) -> result, dependency(name) -> awaitable
+        self._values = dict(resolved or {})
+        self._tasks = {}
+
+    def _fetch(self, name):
+        if name not in self._tasks:
+            self._tasks[name] = asyncio.ensure_future(self._load(name))
+        return self._tasks[name]
+
+    async def _load(self, name):
+        result = await self._run(self._sources[name], self._fetch)
+        self._values[name] = result
+        return result
+
+    def __getitem__(self, name):
+        if name in self._values:
+            return self._values[name]
+        if name in self._sources:
+            return self._fetch(name)
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        if name not in self._values and name not in self._sources:
+            raise KeyError(name)
+        self._values.pop(name, None)
+        self._sources.pop(name, None)
+
+    def __iter__(self):
+        return iter({**dict.fromkeys(self._sources), **self._values})
+
+    def __len__(self):
+        return len(self._sources.keys() | self._values.keys())
+
+    def resolved(self):
+        """Sources fetched so far, plus values set by hooks."""
+        return dict(self._values)
+
+    def __repr__(self):
+        return f"NebuloidLazyData({self._values!r}, pending={sorted(self._sources.keys() - self._values.keys())})"
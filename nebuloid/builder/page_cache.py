@@ -0,0 +1,64 @@
+import hashlib
+import json
+from contextvars import ContextVar
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+# set by NebuloidBuilder.build() while rendering a page whose caching is bypassed
+cache_bypass = ContextVar("nebuloid_cache_bypass", default=False)
+
+def fingerprint(value):
+    """Short digest of template data, used to key rendered output."""
+    encoded = json.dumps(value, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+class NebuloidCacheExtension(Extension):
+    """{% cache "name", vary... %}...{% endcache %}: reuse a rendered fragment while the vary values are unchanged."""
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)  # a NebuloidCache, set by the builder
+        self.versions = {}  # template name -> fingerprint of the source last compiled
+
+    def preprocess(self, source, name, filename=None):
+        # compiled into the fragment keys, so an edited template doesn't reuse the old fragments
+        self.versions[name] = fingerprint(source)
+        return source
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        method = "_cache_support_async" if self.environment.is_async else "_cache_support"
+        template = nodes.Const((parser.name, self.versions.get(parser.name)))
+        call = self.call_method(method, [template, nodes.List(args)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, template, args, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or cache_bypass.get():
+            return caller()
+
+        key = (*template, fingerprint(args))
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = caller()
+            cache.set(key, rendered, size=len(rendered))
+        return rendered
+
+    async def _cache_support_async(self, template, args, caller):
+        cache = self.environment.fragment_cache
+        if cache is None or cache_bypass.get():
+            return await caller()
+
+        key = (*template, fingerprint(args))
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = await caller()
+            cache.set(key, rendered, size=len(rendered))
+        return rendered
@@ -0,0 +1,65 @@
+import os, yaml
+from types import MappingProxyType
+from typing import NamedTuple, Optional, Tuple
+
+from nebuloid.manifest.manifest import freeze
+
+# libyaml's loader when PyYAML was built with it, the pure Python one otherwise
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+class NebuloidPagePlan(NamedTuple):
+    """Compiled, read-only form of a pages/<route>/recipe.yaml."""
+    route_name: str
+    template_path: str
+    page: MappingProxyType
+    sources: Optional[Tuple[MappingProxyType, ...]]  # None when the recipe has no data section
+    mtime: Tuple[int, Optional[int]]  # of recipe.yaml and access.yaml, see plan_mtime()
+    cache: MappingProxyType  # page.cache of the recipe, overridden by the cache section of access.yaml
+    lazy: bool  # data.lazy: sources are fetched when the template first reads them
+
+def recipe_path(base_dir, route_name):
+    return os.path.join(base_dir, route_name, "recipe.yaml")
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def recipe_mtime(base_dir, route_name):
+    return file_mtime(recipe_path(base_dir, route_name))
+
+def plan_mtime(base_dir, route_name):
+    """What a compiled plan is fresh against: its cache section also comes from access.yaml."""
+    return (recipe_mtime(base_dir, route_name), file_mtime(os.path.join(base_dir, route_name, "access.yaml")))
+
+def compile_plan(base_dir, route_name) -> NebuloidPagePlan:
+    recipe_file = recipe_path(base_dir, route_name)
+    mtime = plan_mtime(base_dir, route_name)
+    if mtime[0] is None:
+        raise FileNotFoundError(f"Recipe not found for route '{route_name}'")
+
+    with open(recipe_file, "r") as f:
+        recipe_data = yaml.load(f, Loader=SafeLoader) or {}
+
+    page_data = recipe_data.get("page", {})
+    template_name = page_data.get("template")
+    if not template_name:
+        raise ValueError(f"⚠ No template defined in recipe for '{route_name}'")
+
+    # Ensure clean relative path
+    template_path = os.path.normpath(os.path.join(route_name, template_name)).replace("\\", "/")
+
+    cache = dict(page_data.get("cache") or {})
+    access_file = os.path.join(base_dir, route_name, "access.yaml")
+    if os.path.exists(access_file):
+        with open(access_file, "r") as f:
+            cache.update((yaml.load(f, Loader=SafeLoader) or {}).get("cache") or {})
+
+    meta_data = recipe_data.get("data")
+    sources = None
+    if meta_data:
+        sources = freeze(meta_data['sources'])
+
+    lazy = bool(meta_data and meta_data.get('lazy'))
+    return NebuloidPagePlan(route_name, template_path, freeze(page_data), sources, mtime, freeze(cache), lazy)
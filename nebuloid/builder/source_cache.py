@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+from nebuloid.core.cache import NebuloidCache
+
+SCOPES = ("global", "role", "user")
+
+def source_signature(source):
+    """Stable text form of a source definition, so same-named sources of different recipes don't share entries."""
+    def plain(value):
+        if hasattr(value, "items"):
+            return {key: plain(item) for key, item in value.items() if key != "cache"}
+        if isinstance(value, (list, tuple)):
+            return [plain(item) for item in value]
+        return value
+    return json.dumps(plain(source), sort_keys=True, default=str)
+
+class NebuloidSourceCache:
+    """Results of recipe sources declaring `cache: {ttl, scope, max_entries}`.
+
+    Concurrent misses for the same key share a single fetch.
+    """
+    def __init__(self, orm):
+        self.orm = orm
+        self.caches = {}    # source name -> NebuloidCache
+        self.inflight = {}  # (source name, key) -> Future
+        self.settings = {}    # source name -> {route name: (max_entries, ttl)}
+        self.signatures = {}  # source name -> {route name: (source, signature)}
+
+    def register(self, route_name, sources):
+        """Index the cached sources of a freshly compiled recipe, replacing the route's previous ones.
+
+        Same-named sources share one cache, so their settings have to agree across recipes.
+        """
+        previous = {}  # source name -> settings of the route's last compile
+        for name, routes in list(self.settings.items()):
+            if route_name in routes:
+                previous[name] = routes.pop(route_name)
+                self.signatures.get(name, {}).pop(route_name, None)
+            if not routes:
+                del self.settings[name]
+                self.signatures.pop(name, None)
+
+        for source in sources or ():
+            if not (conf := source.get("cache")):
+                continue
+            name = source["name"]
+            settings = (conf.get("max_entries", 256), conf.get("ttl", 60))
+            routes = self.settings.setdefault(name, {})
+            for other, other_settings in routes.items():
+                if other_settings != settings:
+                    raise ValueError(f"Source '{name}' is cached with different max_entries/ttl in '{other}' and '{route_name}'")
+            if previous.pop(name, settings) != settings:
+                self.caches.pop(name, None)  # the recipe changed its settings
+            routes[route_name] = settings
+            self.signatures.setdefault(name, {})[route_name] = (source, source_signature(source))
+
+        # sources the recipe dropped, now cached for no route at all
+        for name in previous:
+            if name not in self.settings:
+                self.caches.pop(name, None)
+
+    def signature(self, source):
+        # plans are immutable, so a registered source's signature only needs computing once
+        for known, signature in self.signatures.get(source["name"], {}).values():
+            if known is source:
+                return signature
+        return source_signature(source)
+
+    async def scope_key(self, scope, user):
+        if scope == "global":
+            return ("global", None)
+        if scope == "role":
+            return ("role", await user.get_role())
+        if scope == "user":
+            return ("user", user.user_id)
+        raise ValueError(f"Invalid cache scope '{scope}'. Use one of {', '.join(SCOPES)}.")
+
+    async def get(self, source, user, fetch, params=None):
+        """Cached result of `source` for this user (the request's NebuloidUserLoader) and route parameters, calling `fetch()` on a miss."""
+        conf = source["cache"]
+        name = source["name"]
+        scope = await self.scope_key(conf.get("scope", "global"), user)
+        key = (*scope, self.signature(source), tuple(sorted((params or {}).items())))
+
+        max_entries, ttl = conf.get("max_entries", 256), conf.get("ttl", 60)
+        cache = self.caches.get(name)
+        if cache is None:
+            cache = self.caches[name] = NebuloidCache(max_entries=max_entries, ttl=ttl)
+        elif (cache.max_entries, cache.ttl) != (max_entries, ttl):
+            raise ValueError(f"Source '{name}' is cached with max_entries={cache.max_entries}, ttl={cache.ttl} elsewhere")
+
+        result = cache.get(key)
+        if result is not None:
+            return result
+
+        flight = self.inflight.get((name, key))
+        if flight is None:
+            async def load():
+                try:
+                    result = await fetch()
+                    if not (isinstance(result, dict) and result.get("status") == "error"):
+                        cache.set(key, result)
+                    return result
+                finally:
+                    self.inflight.pop((name, key), None)
+
+            flight = self.inflight[(name, key)] = asyncio.ensure_future(load())
+
+        # shielded: one waiter timing out must not cancel the fetch the others share
+        return await asyncio.shield(flight)
+
+    def invalidate(self, name=None, role=None, user_id=None):
+        """Drop cached results: everything, one source, or one source for one role or user."""
+        if name is None:
+            for cache in self.caches.values():
+                cache.clear()
+            return
+
+        cache = self.caches.get(name)
+        if cache is None:
+            return
+        if role is None and user_id is None:
+            cache.clear()
+            return
+
+        for key in cache.keys():
+            if (role is not None and key[:2] == ("role", role)) or (user_id is not None and key[:2] == ("user", user_id)):
+                cache.pop(key)
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
@@ -1,59 +1,108 @@
 import os, yaml
+from typing import NamedTuple
+
+class AccessPolicy(NamedTuple):
+    """Compiled `access` section of an access.yaml."""
+    open: bool            # no rules at all
+    login_required: bool
+    any_role: bool        # roles_allowed is "*" (or of an unknown type, as before)
+    role_mask: int        # bit per allowed role, see AccessTable.role_ids
+    mtime: int            # of access.yaml, None when the route has none
+
+OPEN_POLICY = AccessPolicy(True, False, True, 0, None)
+
+class AccessTable(NamedTuple):
+    """One version of the compiled rules of every route; replaced as a whole on reload."""
+    rules: dict       # route name -> access.yaml contents
+    policies: dict    # route name -> AccessPolicy
+    decisions: dict   # (route name, role, logged_in) -> (allowed, reason), filled on use
+    role_ids: dict    # role name -> bit index in this table's masks
 
 class NebuloidAccess:
     def __init__(self, services, base_dir="pages"):
         services.inject_services(self)
         self.base_dir = base_dir
-        self.access_rules = {}          # URL -> rules dict
+        self.table = AccessTable({}, {}, {}, {})
+        self.max_decisions = 4096
 
     def mount(self):
-        self.access_rules = {}
-        for _, routes in self.manifest.data['server']['routes'].items():
-            if isinstance(routes, str):
-                routes = [routes]  # Take the first route if multiple are defined
-            for route_name in routes:
-                access_file = os.path.join(self.base_dir, route_name, "access.yaml")
-                rules = {}
-                if os.path.exists(access_file):
+        self.table = self.compile_table(self.manifest.data['server']['routes'])
+
+    def access_file(self, route_name):
+        return os.path.join(self.base_dir, route_name, "access.yaml")
+
+    def compile_table(self, routes):
+        """Read and compile the access.yaml of every route; safe to run off the event loop.
+
+        Role bits are numbered per table, so a reload never touches the one being served.
+        """
+        rules, policies, role_ids = {}, {}, {}
+        for _, route_names in routes.items():
+            if isinstance(route_names, str):
+                route_names = [route_names]
+            for route_name in route_names:
+                access_file = self.access_file(route_name)
+                route_rules, mtime = {}, None
+                try:
+                    mtime = os.stat(access_file).st_mtime_ns
                     with open(access_file, "r") as f:
-                        data = yaml.safe_load(f) or {}
-                        rules = data
-                self.access_rules[route_name] = rules
+                        route_rules = yaml.safe_load(f) or {}
+                except FileNotFoundError:
+                    pass
+                rules[route_name] = route_rules
+                policies[route_name] = self.compile(route_rules, mtime, role_ids)
+        return AccessTable(rules, policies, {}, role_ids)
 
-    def get_access_rule(self, name):
-        return self.access_rules.get(name, {})
-    
-    def can_access(self, route_name, user_access_data):
-        rules = self.get_access_rule(route_name).get("access", {})
+    @staticmethod
+    def role_bit(role, role_ids):
+        """Bit for a role name, numbering it in role_ids when new."""
+        if role not in role_ids:
+            role_ids[role] = len(role_ids)
+        return 1 << role_ids[role]
+
+    def compile(self, rules, mtime=None, role_ids=None):
+        role_ids = {} if role_ids is None else role_ids
+        rules = rules.get("access", {})
         if not rules:
-            return True, "Open Access"  # No rules means open access
+            return OPEN_POLICY._replace(mtime=mtime)
 
-        user_role = user_access_data.get("role")
-        logged_in = user_access_data.get("logged_in", False)
+        allowed_roles = rules.get("roles_allowed", "*")
+        mask = 0
+        if isinstance(allowed_roles, list):
+            for role in allowed_roles:
+                mask |= self.role_bit(role, role_ids)
+        elif isinstance(allowed_roles, str) and allowed_roles != "*":
+            mask = self.role_bit(allowed_roles, role_ids)
+        any_role = not mask and not isinstance(allowed_roles, list)
+        return AccessPolicy(False, bool(rules.get("login_required")), any_role, mask, mtime)
 
-        # Check 'login_required' rule
-        if rules.get("login_required") and not logged_in:
-            return False, "login_required"
+    def watched_files(self, table=None):
+        """access.yaml path -> mtime it was compiled from (None when absent)."""
+        table = table or self.table
+        return {self.access_file(route_name): policy.mtime for route_name, policy in table.policies.items()}
 
-        # Check 'roles' rule
-        allowed_roles = rules.get("roles_allowed","*")  # Default to role 0 (public)
-        if not self.role_check(user_role, allowed_roles):
-            return False, f"Role {user_role} not allowed"
+    def get_access_rule(self, name):
+        return self.table.rules.get(name, {})
 
-        return True, "Access granted"
-    
-    def role_check(self, user_role, allowed_roles):
-        print("allowed roles", allowed_roles, type(allowed_roles), "User role", user_role)
-        if isinstance(allowed_roles, list):
-            if user_role not in allowed_roles:
-                return False
-            else:
-                print("User exists")
-        elif isinstance(allowed_roles, str):
-            if allowed_roles != user_role and allowed_roles != '*':
-                return False
-            else:
-                print("All alowed or specific allowed")
-        else:
-            print("Unknown roles list type")
-        return True
\ No newline at end of file
+    def can_access(self, route_name, user_access_data, table=None):
+        table = table or self.table
+        role = user_access_data.get("role")
+        logged_in = bool(user_access_data.get("logged_in", False))
+
+        key = (route_name, role, logged_in)
+        decision = table.decisions.get(key)
+        if decision is None:
+            decision = self.decide(table.policies.get(route_name, OPEN_POLICY), role, logged_in, table.role_ids)
+            if len(table.decisions) >= self.max_decisions:
+                table.decisions.clear()
+            table.decisions[key] = decision
+        return decision
+
+    def decide(self, policy, role, logged_in, role_ids):
+        if policy.open:
+            return True, "Open Access"  # No rules means open access
+        if policy.login_required and not logged_in:
+            return False, "login_required"
+        if policy.any_role or policy.role_mask & (1 << role_ids[role] if role in role_ids else 0):
+            return True, "Access granted"
+        return False, f"Role {role} not allowed"
@@ -0,0 +1,41 @@
+import gzip
+import hashlib
+from typing import NamedTuple
+
+from nebuloid.builder.assets import COMPRESSIBLE, brotli
+from .cache import NebuloidCache
+
+class CachedAsset(NamedTuple):
+    body: bytes
+    etag: str        # unquoted
+    variants: dict   # content-encoding -> compressed body, only when smaller than body
+
+class NebuloidAssetCache:
+    """Small, frequently served files kept in memory with their ETag and precompressed bodies.
+
+    Entries are keyed by path, mtime and size, so an edited file is simply a new entry.
+    """
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_file_size=128 * 1024):
+        self.max_file_size = max_file_size
+        self.cache = NebuloidCache(max_entries=4096, max_bytes=max_bytes)
+
+    def get(self, path, stat):
+        if stat.st_size > self.max_file_size:
+            return None
+
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        asset = self.cache.get(key)
+        if asset is None:
+            with open(path, "rb") as f:
+                body = f.read()
+
+            variants = {}
+            if path.endswith(COMPRESSIBLE):
+                if brotli is not None:
+                    variants["br"] = brotli.compress(body)
+                variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+                variants = {enc: data for enc, data in variants.items() if len(data) < len(body)}
+
+            asset = CachedAsset(body, hashlib.blake2b(body, digest_size=16).hexdigest(), variants)
+            self.cache.set(key, asset, size=len(body) + sum(map(len, variants.values())))
+        return asset
@@ -71,9 +71,12 @@ class Nebuloid:
                 await self.plugins.hook("before_server_start")
                 self.expose_api.ready()
                 await self.server.ready()
+                await self.orm.ready()
+                self.services.freeze()
                 # background tasks
                 asyncio.create_task(self.orm.maintenance_task())
                 asyncio.create_task(self.storage.maintenance_task())
+                asyncio.create_task(self.server.reloader.maintenance_task())
                 await self._start_background_hooks()
 
             
@@ -94,10 +97,17 @@ class Nebuloid:
                 await self.plugins.hook("before_server_start")
                 self.expose_api.ready()
                 await self.server.ready()
+                await self.orm.ready()
+                self.services.freeze()
                 asyncio.create_task(self.orm.maintenance_task())
                 asyncio.create_task(self.storage.maintenance_task())
+                asyncio.create_task(self.server.reloader.maintenance_task())
                 await self._start_background_hooks()
 
+            @self.app.after_serving
+            async def shutdown_tasks():
+                await self.server.builder.http.aclose()
+
 
     @property
     def wsgi(self):
@@ -124,7 +134,7 @@ class Nebuloid:
 
     async def _start_background_hooks(self):
         sources = [
-            self.plugins.manifest.plugin_registry.get("run", []),
+            [handler.func for handler in self.plugins.handlers("run")],
             self.manifest.func_registry.get("background", {}).values()
         ]
         tasks = []
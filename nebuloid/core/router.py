@@ -0,0 +1,113 @@
+import re
+from typing import NamedTuple, Tuple
+
+# /static_<route>/..., /plugin_<method>/..., /utils_<file>
+SYSTEM_PREFIXES = {"static_": "static", "plugin_": "plugin", "utils_": "utils"}
+
+PARAM = re.compile(r"^<(?:(\w+):)?(\w+)>$")
+CONVERTERS = {"int": int, "str": str}  # tried in this order
+
+def system_branch(url):
+    """Which built-in branch of catch_all serves url, None for pages."""
+    if url.startswith("/api"):
+        return "api"
+    return SYSTEM_PREFIXES.get(url[1:url.find("_", 1) + 1])
+
+class RouteMatch(NamedTuple):
+    pattern: str
+    candidates: Tuple[str, ...]  # route names, in manifest order
+    params: dict
+
+class Endpoint(NamedTuple):
+    pattern: str
+    candidates: Tuple[str, ...]
+    params: Tuple[str, ...]  # names of the captured segments, in order
+    wildcard: str  # name of the trailing <path:...> / * capture, "" without one
+
+class Node:
+    __slots__ = ("static", "params", "wildcard", "endpoint")
+
+    def __init__(self):
+        self.static = {}      # segment -> Node
+        self.params = {}      # converter name -> Node for any single segment it accepts
+        self.wildcard = None  # Endpoint taking the rest of the path
+        self.endpoint = None
+
+class NebuloidRouter:
+    """Segment trie over the manifest routes.
+
+    Patterns may contain `<name>` / `<int:name>` segments and a trailing
+    `<path:name>` or `*` that captures the rest of the path. Static segments
+    win over parameters, parameters over wildcards.
+    """
+    def __init__(self):
+        self.root = Node()
+        self.exact = {}  # parameterless urls skip the trie entirely
+
+    @classmethod
+    def compile(cls, routes):
+        router = cls()
+        for pattern, route_names in routes.items():
+            router.add(pattern, (route_names,) if isinstance(route_names, str) else tuple(route_names))
+        return router
+
+    def add(self, pattern, candidates):
+        segments = [seg for seg in pattern.strip("/").split("/") if seg]
+        node, params = self.root, []
+        for i, seg in enumerate(segments):
+            match = PARAM.match(seg)
+            if seg == "*" or (match and match.group(1) == "path"):
+                if i != len(segments) - 1:
+                    raise ValueError(f"Wildcard must be the last segment of route '{pattern}'")
+                node.wildcard = Endpoint(pattern, candidates, tuple(params), match.group(2) if match else "path")
+                return
+            if match:
+                converter = match.group(1) or "str"
+                if converter not in CONVERTERS:
+                    raise ValueError(f"Unknown converter '{converter}' in route '{pattern}'")
+                params.append(match.group(2))
+                node = node.params.setdefault(converter, Node())
+            else:
+                node = node.static.setdefault(seg, Node())
+
+        node.endpoint = Endpoint(pattern, candidates, tuple(params), "")
+        if not params:
+            self.exact["/" + "/".join(segments)] = node.endpoint
+
+    def match(self, url):
+        endpoint = self.exact.get(url) or self.exact.get(url.rstrip("/") or "/")
+        if endpoint is not None:
+            return RouteMatch(endpoint.pattern, endpoint.candidates, {})
+
+        segments = [seg for seg in url.strip("/").split("/") if seg]
+        found = self._match(self.root, segments, 0, [])
+        if found is None:
+            return None
+        endpoint, values, rest = found
+
+        params = dict(zip(endpoint.params, values))
+        if endpoint.wildcard:
+            params[endpoint.wildcard] = rest
+        return RouteMatch(endpoint.pattern, endpoint.candidates, params)
+
+    def _match(self, node, segments, i, values):
+        if i == len(segments):
+            if node.endpoint is not None:
+                return node.endpoint, values, ""
+        else:
+            seg = segments[i]
+            child = node.static.get(seg)
+            if child is not None and (found := self._match(child, segments, i + 1, values)):
+                return found
+            for converter, convert in CONVERTERS.items():
+                if (child := node.params.get(converter)) is None:
+                    continue
+                try:
+                    value = convert(seg)
+                except ValueError:
+                    continue
+                if found := self._match(child, segments, i + 1, values + [value]):
+                    return found
+        if node.wildcard is not None and i < len(segments):
+            return node.wildcard, values, "/".join(segments[i:])
+        return None
@@ -1,12 +1,17 @@
-import importlib.resources as pkg_resources
-import mimetypes, io, os
-from pathlib import Path
+import mimetypes, os
+import inspect
 from nebuloid.api import NebuloidAPI
+from nebuloid.api.context import NebuloidUserLoader
 from .access import NebuloidAccess
+from .assets import NebuloidAssetCache
+from .router import NebuloidRouter, system_branch
+from .snapshot import NebuloidReloader, NebuloidSnapshot
 
 
 from nebuloid.builder import NebuloidBuilder
 
+IMMUTABLE = "public, max-age=31536000, immutable"
+
 class NebuloidServer:
     def __init__(self, services, base_dir="pages", shared_dir="shared"):
         services.inject_services(self)
@@ -19,14 +24,39 @@ class NebuloidServer:
         services.add(api=self.api)
 
         self.builder = NebuloidBuilder(services, base_dir)
+        services.add(builder=self.builder)
         self.access = NebuloidAccess(services, base_dir)
+        self.asset_cache = None
+        self.router = NebuloidRouter()
+        self.snapshot = None  # NebuloidSnapshot every request reads its configuration from
+        self.reloader = NebuloidReloader(services, self)
 
     def mount(self):
         if not self.app:
             raise RuntimeError("App not attached to server.")
 
+        # opt-in: small static/utils files served from memory
+        asset_conf = self.manifest.data.get('cache', {}).get('assets')
+        if asset_conf:
+            self.asset_cache = NebuloidAssetCache(
+                max_bytes=asset_conf.get('max_bytes', 8 * 1024 * 1024),
+                max_file_size=asset_conf.get('max_file_size', 128 * 1024)
+            )
+
         self.access.mount()
+        self.router = NebuloidRouter.compile(self.manifest.data['server']['routes'])
+        self.snapshot = NebuloidSnapshot(self.manifest.version, self.manifest.data, self.router, self.access.table)
+        self.reloader.mount()
         self.api.mount()
+        self.builder.mount()
+
+        if not self.use_flask and self.manifest.data.get('api', {}).get('websocket', False):
+            @self.app.websocket("/api_ws")
+            async def api_ws():
+                from quart import websocket
+                cookies = websocket.cookies
+                await self.plugins.hook("on_request", path="api_ws", method="WEBSOCKET", cookies=cookies, query=websocket.args, body=None)
+                await self.api.handle_ws(websocket, cookies.get("session_id"))
         
         @self.app.route("/", defaults={"path": ""}, methods=["GET", "POST", "PUT", "DELETE"])
         @self.app.route("/<path:path>", methods=["GET", "POST", "PUT", "DELETE"])
@@ -39,28 +69,33 @@ class NebuloidServer:
             method = request.method
             cookies = request.cookies
             query = request.args
-            body = self.tools.ensure_sync(request.get_data())
+            body = await self.tools.maybe_await(request.get_data())
 
             await self.plugins.hook("on_request", path=path, method=method, cookies=cookies, query=query, body=body)
 
             print("Request:", method, url, "Cookies:", cookies, "Query:", query, "Body:", body)
 
-            session_id = cookies.get("session_id")
+            session_cookie = cookies.get("session_id")
 
-            if url.startswith("/api"):
-                return await self.api.handle(url, body, session_id)
-            elif url.startswith("/static_"): # /static_<route_name>/<file>
+            branch = system_branch(url)
+            if branch == "api":
+                return await self.api.handle(url, body, session_cookie, request.content_type)
+            elif branch == "static": # /static_<route_name>/<file>
                 route_name, file_name = url[8:].rsplit("/", 1)
                 mime_type, _ = mimetypes.guess_type(file_name)
                 if not mime_type:
                     mime_type = "application/octet-stream"
-                print("joiners", self.base_dir, route_name, 'static', file_name)
-                file_path = os.path.normpath(os.path.join(self.base_dir, route_name, 'static', file_name)).replace("\\", "/")
-                with open(file_path,'rb') as f:
-                    datas = io.BytesIO(f.read())
+                static_dir = os.path.normpath(os.path.join(self.base_dir, route_name, 'static'))
+                file_path = os.path.normpath(os.path.join(static_dir, file_name))
+                # route_name comes from the URL as well, neither part may leave base_dir
+                base_dir = os.path.abspath(self.base_dir)
+                if os.path.commonpath([base_dir, os.path.abspath(static_dir)]) != base_dir or not file_path.startswith(static_dir + os.sep):
+                    return {"error": "file_not_found"}, 404
 
-                return await self.tools.maybe_await(send_file(datas, mimetype=mime_type))
-            elif url.startswith("/plugin_"): # /plugin_<method>/<file_id>
+                # static() links carry the content hash, such a URL never changes content
+                immutable = request.args.get("v") and request.args.get("v") == self.builder.assets.static_hash(file_path)
+                return await self.send_path(request, file_path, mime_type, IMMUTABLE if immutable else None)
+            elif branch == "plugin": # /plugin_<method>/<file_id>
                 method, file_id = url[8:].split("/", 1)
                 file_name, file_path = self.manifest.get_file(file_id)
                 if not file_name or not file_path or not os.path.exists(file_path):
@@ -84,59 +119,119 @@ class NebuloidServer:
                     ))
                 else:
                     return {"error": "invalid_method"}, 400
-            elif url.startswith("/utils_"):
+            elif branch == "utils":
                 file_name = url[7:]
+                asset = self.builder.assets.files.get(file_name)
+                file_path = self.builder.utils_index.get(file_name)
+                if asset is None and file_path is None:
+                    return {"error": "file_not_found"}, 404
+
                 mime_type, _ = mimetypes.guess_type(file_name)
                 if not mime_type:
                     mime_type = "application/octet-stream"
-                file_path_in_pkg = pkg_resources.files('nebuloid.utils').joinpath(file_name)
-
-                if file_path_in_pkg.exists():
-                    with file_path_in_pkg.open('rb') as f:
-                        datas = io.BytesIO(f.read())
-                elif (Path(self.shared_dir) / file_name).exists():
-                    with open((Path(self.shared_dir) / file_name), 'rb') as f:
-                        datas = io.BytesIO(f.read())
-                elif (self.storage.dir('utils') / file_name).exists():
-                    with open((self.storage.dir('utils') / file_name), 'rb') as f:
-                        datas = io.BytesIO(f.read())
-                else:
-                    raise FileNotFoundError(f"{file_name} not found in nebuloid.utils or current folder")
-                return await self.tools.maybe_await(send_file(datas, mimetype=mime_type))
+                if asset is not None:
+                    return await self.send_asset(request, asset, mime_type)
+                return await self.send_path(request, file_path, mime_type)
 
+            session_id = self.api.resolve_session(session_cookie)
             user_id, user_access_data = await self.orm.get_user_access_data(session_id)
 
-            # Find matching route
+            # Find matching route, all against one configuration version even if a reload lands meanwhile
+            snapshot = self.snapshot
             req_route = None
-            routes = self.manifest.data['server']['routes'].get(url)
-            if routes:
-                if isinstance(routes, str):
-                    routes = [routes]
-
-                for route_name in routes:
-                    access_bool, res = self.access.can_access(route_name, user_access_data)
-                    print(f"reason: {res}")
+            match = snapshot.router.match(url)
+            if match:
+                for route_name in match.candidates:
+                    access_bool, res = self.access.can_access(route_name, user_access_data, snapshot.access)
                     if access_bool:
                         req_route = (url, route_name)
                         break
                     elif res == "login_required":
-                        return redirect(self.manifest.data['auth']['login_url'])
+                        return redirect(snapshot.data['auth']['login_url'])
                     
+            # one lazily resolved profile for every hook and data source of this page
+            user = NebuloidUserLoader(self.orm, user_id=user_id, role=user_access_data.get("role") if user_id is not None else None)
+
             if not req_route:
-                html = await self.builder.build("404", user_id)
-                return html, 404
+                return await self.render_page("404", user_id, user, 404)
 
             _, route_name = req_route
 
             try:
-                html = await self.builder.build(route_name, user_id)
-                return html
+                return await self.render_page(route_name, user_id, user, params=match.params)
             except FileNotFoundError as e:
                 return str(e), 500
+
+    async def send_asset(self, request, asset, mime_type):
+        """A built utils module, precompressed when the client accepts it."""
+        path, encodings = asset
+        # q-values count: "br;q=0" refuses br
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding:
+            path += ".br" if encoding == "br" else ".gz"
+
+        response = await self.send_path(request, path, mime_type, IMMUTABLE, compress=False)
+        if isinstance(response, tuple):  # the file went away since the assets were built
+            return response
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    async def send_path(self, request, path, mime_type, cache_control=None, compress=True):
+        """Serve a file from disk with ETag/304 and Range handling, or from the asset cache when it fits."""
+        if self.use_flask:
+            from flask import send_file
+        else:
+            from quart import send_file
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return {"error": "file_not_found"}, 404
+
+        asset = self.asset_cache.get(path, stat) if self.asset_cache else None
+        if asset is None:
+            # Flask resolves relative paths against the app's root_path, not the working directory
+            response = await self.tools.maybe_await(send_file(os.path.abspath(path), mimetype=mime_type, conditional=True))
+        else:
+            encoding = request.accept_encodings.best_match(asset.variants) if compress else None
+            etag = f"{asset.etag}-{encoding}" if encoding else asset.etag
+
+            if request.if_none_match.contains(etag):
+                response = await self.api.respond(b"", 304)
+            else:
+                # cached bodies are small, Range requests get the whole body (allowed by RFC 9110)
+                response = await self.api.respond(asset.variants[encoding] if encoding else asset.body, 200, mime_type)
+                if encoding:
+                    response.headers["Content-Encoding"] = encoding
+            response.set_etag(etag)
+            if asset.variants and compress:
+                response.headers["Vary"] = "Accept-Encoding"
+
+        if cache_control:
+            response.headers["Cache-Control"] = cache_control
+        return response
+
+    async def render_page(self, route_name, user_id, user, code=200, params=None):
+        plan = self.builder.get_plan(route_name)  # once per request, it stats recipe.yaml and access.yaml
+        if not plan.page.get("stream"):
+            return await self.builder.build(route_name, user_id, user, params, plan=plan), code
+
+        chunks = await self.builder.build_stream(route_name, user_id, user, params, plan=plan)
+        response = await self.api.respond_stream(chunks, "text/html")
+        response.status_code = code
+        return response
+
     async def ready(self):
+        self.builder.index_utils(self.shared_dir)
         await self.plugins.hook("before_gen_utils")
 
-        await self.builder.gen_utils({'name':'portal.js', 'args':{'func_names': list(self.manifest.func_registry['portal'].keys())}})
+        portal_funcs = self.manifest.func_registry['portal']
+        stream_names = [name for name, func in portal_funcs.items() if inspect.isasyncgenfunction(func) or inspect.isgeneratorfunction(func)]
+        websocket = not self.use_flask and self.manifest.data.get('api', {}).get('websocket', False)
+        max_batch = self.manifest.data.get('api', {}).get('max_batch', 64)
+        await self.builder.gen_utils({'name':'portal.js', 'args':{'func_names': list(portal_funcs.keys()), 'stream_names': stream_names, 'websocket': websocket, 'max_batch': max_batch}})
         print("portl data", self.manifest.func_registry)
 
         public_key = self.storage.file('public_key.pem', "rb")
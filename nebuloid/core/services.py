@@ -1,6 +1,7 @@
 class NebuloidServices:
     def __init__(self, **services):
         self._services = {}
+        self._frozen = False
 
         # set each service dynamically
         for name, instance in services.items():
@@ -14,8 +15,20 @@ class NebuloidServices:
                 setattr(obj, name, instance)
 
     def add(self, **services):
+        if self._frozen:
+            raise RuntimeError(f"Services are frozen once the app is ready, cannot add {', '.join(services)}.")
         for name, instance in services.items():
             if name in self._services:
                 raise ValueError(f"Service {name} already exists.")
             setattr(self, name, instance)
-            self._services[name] = instance
\ No newline at end of file
+            self._services[name] = instance
+
+    def freeze(self):
+        """Called once the app is ready: contexts resolve services on every access, the set must not change under them."""
+        self._frozen = True
+
+    def get(self, name, default=None):
+        """A public service by name, for objects that look services up instead of having them injected."""
+        if name.startswith("_"):
+            return default
+        return self._services.get(name, default)
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+from types import MappingProxyType
+from typing import NamedTuple
+
+from .access import AccessTable
+from .router import NebuloidRouter
+
+logger = logging.getLogger(__name__)
+
+class NebuloidSnapshot(NamedTuple):
+    """Everything a request needs from the configuration, from one and the same load."""
+    version: int
+    data: MappingProxyType   # frozen manifest data
+    router: NebuloidRouter
+    access: AccessTable
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+class NebuloidReloader:
+    """Watches manifest.neb and the access.yaml files and swaps in a new snapshot when one changes.
+
+    The new snapshot is parsed and compiled in a worker thread; only the
+    reference swap happens on the event loop, so requests never see half of it.
+    Settings read at mount (db, plugins, caches) still need a restart.
+    """
+    def __init__(self, services, server):
+        services.inject_services(self)
+        self.server = server
+        self.interval = 2
+        self.watched = {}  # path -> mtime the current snapshot was built from
+
+    def mount(self):
+        self.interval = self.manifest.data.get('server', {}).get('watch_interval', 2)
+        self.watched = self.watch_list(self.server.snapshot)
+
+    def manifest_path(self):
+        return self.storage.files.get(self.manifest.filename)
+
+    def watch_list(self, snapshot):
+        watched = self.server.access.watched_files(snapshot.access)
+        if path := self.manifest_path():
+            watched[path] = mtime(path)
+        return watched
+
+    def build(self, reload_manifest=True):
+        """Load and compile a complete snapshot; runs off the event loop."""
+        data = self.manifest.load_file(self.manifest.filename) if reload_manifest else self.manifest.data
+        routes = data['server']['routes']
+        router = NebuloidRouter.compile(routes)
+        table = self.server.access.compile_table(routes)
+        return NebuloidSnapshot(0, data, router, table)  # numbered by swap()
+
+    def swap(self, snapshot):
+        previous = self.server.snapshot
+        if snapshot.data is not previous.data:
+            self.manifest.swap(snapshot.data)
+        self.server.access.table = snapshot.access
+        self.server.router = snapshot.router
+        self.server.snapshot = snapshot = snapshot._replace(version=previous.version + 1)
+
+        # access.yaml also carries the cache section compiled into page plans
+        for route_name, policy in snapshot.access.policies.items():
+            if previous.access.policies.get(route_name) != policy:
+                self.server.builder.reload_plans(route_name)
+        self.watched = self.watch_list(snapshot)
+
+    def current(self):
+        return {path: mtime(path) for path in self.watched}
+
+    async def reload(self):
+        """Rebuild and swap when a watched file changed; returns the changed paths."""
+        loop = asyncio.get_running_loop()
+        current = await loop.run_in_executor(None, self.current)
+        changed = [path for path, seen in self.watched.items() if current[path] != seen]
+        if changed:
+            self.watched = current  # a broken edit is reported once, not on every tick
+            reload_manifest = self.manifest_path() in changed
+            snapshot = await loop.run_in_executor(None, self.build, reload_manifest)
+            self.swap(snapshot)
+            logger.info("Configuration reloaded (version %s): %s", self.server.snapshot.version, changed)
+        return changed
+
+    async def maintenance_task(self):
+        if not self.interval:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reload()
+            except Exception:
+                # a broken edit keeps the last good snapshot serving
+                logger.exception("Configuration reload failed")
@@ -26,7 +26,7 @@ class NebuloidStorage:
         self.cache_files = {}
 
         self.files = {'private_key.pem': None, 'public_key.pem': None, 'manifest.neb': None}
-        self.dirs = {'utils': None, 'plugins': None, 'cache': None}
+        self.dirs = {'utils': None, 'plugins': None, 'cache': None, 'bytecode': None}
 
         exts = [".neb", ".pem", ".json"]
         for root, dirs, files in os.walk('./nucleus'):
@@ -55,6 +55,11 @@ class NebuloidStorage:
     
     def mount(self):
         clear_folder(self.dir('cache'))
+
+        # compiled templates, kept across restarts unlike 'cache'
+        if self.dirs['bytecode'] is None:
+            self.dirs['bytecode'] = os.path.join(os.path.dirname(self.dirs['cache']), 'bytecode')
+            os.makedirs(self.dirs['bytecode'], exist_ok=True)
     
     async def maintenance_task(self):
         while True:
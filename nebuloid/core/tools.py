@@ -18,4 +18,18 @@ class NebuloidTools:
     async def maybe_await(self, obj):
         if inspect.isawaitable(obj):
             return await obj
-        return obj
\ No newline at end of file
+        return obj
+
+    def iter_sync(self, agen):
+        """Drive an async generator from sync code (Flask streaming responses)."""
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            loop.run_until_complete(agen.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())  # e.g. HTTP clients opened while rendering
+            loop.close()
@@ -1,8 +1,28 @@
 import json
+from types import MappingProxyType
+
+def freeze(value):
+    """Read-only copy of parsed JSON/YAML: dicts become mappingproxies, lists tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value):
+    """Mutable copy of frozen data, for code that owns what it is handed (plugin configs)."""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
 class NebuloidManifest:
     def __init__(self, storage):
         self._profile = None
-        self.data = {}
+        self.data = freeze({})  # replaced as a whole on every load, never mutated
+        self.version = 0
+        self.filename = "manifest.neb"
         self.func_registry = {"portal": {}, "background": {}}
         self.plugin_registry = {}
         self.file_registry = {}  # file_id -> (file_name, file_path)
@@ -31,14 +51,20 @@ class NebuloidManifest:
     def _load_profile(self):
         print("loaded profile!!:", self._profile)
     
-    def from_file(self, filename):
+    def load_file(self, filename):
+        """Parsed, frozen manifest data; doesn't touch the current one."""
         # todo: verify and validate manifest before and after load
         manifest_file = self.storage.file(filename, 'r')
         with manifest_file as f:
-            manifest_data = json.load(f)
+            return freeze(json.load(f))
 
-        self.data.clear()
-        self.data.update(manifest_data)
+    def from_file(self, filename):
+        self.filename = filename
+        self.swap(self.load_file(filename))
 
+    def swap(self, data):
+        # requests holding the previous data keep a consistent view of it
+        self.data = data
+        self.version += 1
         self.base_url = self.data.get("server", {}).get("base_url", None)
     
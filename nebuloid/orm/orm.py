@@ -1,22 +1,55 @@
-from sqlalchemy import select, update, text
+from sqlalchemy import select, update, delete, text
 from urllib.parse import quote_plus
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from contextlib import asynccontextmanager, contextmanager
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import create_engine
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
+from typing import NamedTuple, Optional
 
-from .orm_models import Base, Key, User, Role
+from nebuloid.core.cache import NebuloidCache
+from .orm_models import Base, Key, Login, User, Role
 import asyncio
+import time
+
+# auth_logins.logged_in of a ticket session after logout: copies of its ticket
+# may still be around (other tabs, a leaked cookie), the session never logs in again
+REVOKED = -1
+
+class CachedKey(NamedTuple):
+    """Detached snapshot of an auth_keys (or auth_logins) row, as held by the session key cache."""
+    session: str
+    key: Optional[bytes]
+    user_id: Optional[int]
+    logged_in: int
 
 class NebuloidORM:
     def __init__(self, manifest, tools, use_flask):
         self.manifest = manifest
         self.tools = tools
         self.use_flask = use_flask
+
+        self.key_cache = NebuloidCache()
+        self.roles = {}  # role id -> role name, see load_roles()
+        self.roles_loaded_at = None  # monotonic time of the last load_roles()
+        self.roles_miss_interval = 5  # unknown role ids reload the table at most this often
+        self.login_model = Key
     
     def mount(self):
-        # Placeholder for ORM mounting logic
+        # with stateless session tickets the key travels in the cookie and
+        # only the login state is stored, in the small auth_logins table
+        api_conf = self.manifest.data.get("api", {})
+        self.login_model = Login if api_conf.get("session_mode") == "ticket" else Key
+        self.ticket_ttl = api_conf.get("ticket_ttl", 3600)
+
+        # session_id -> CachedKey, so /api_* calls skip the auth_keys lookup
+        key_cache_conf = self.manifest.data.get("cache", {}).get("session_keys", {})
+        self.key_cache = NebuloidCache(
+            max_entries=key_cache_conf.get("max_entries", 10000),
+            ttl=key_cache_conf.get("ttl", 300)
+        )
+        self.roles_refresh = self.manifest.data.get("cache", {}).get("roles_refresh", 300)
+
         self.engine = self.connect_db(self.manifest.data['db']['cred'])
         if self.use_flask:
             self.Session = sessionmaker(bind=self.engine)
@@ -24,6 +57,23 @@ class NebuloidORM:
             self.Session = async_sessionmaker(bind=self.engine)
         self.session = self.Session()
         print("Database connected:", self.engine)
+
+        if self.use_flask:
+            # sync engine: the role table can be loaded right away,
+            # async engines load it from the startup hook (see Nebuloid.init)
+            try:
+                with self.Session() as session:
+                    self.roles = dict(session.execute(select(Role.id, Role.name)).fetchall())
+                    self.roles_loaded_at = time.monotonic()
+            except Exception as e:
+                print("Role table load error:", e)
+
+    async def ready(self):
+        if not self.roles:
+            try:
+                await self.load_roles()
+            except Exception as e:
+                print("Role table load error:", e)
     
     def connect_db(self, cred):
         # db_type="mysql", username="", password="", host="localhost", port=None, database=""
@@ -112,37 +162,87 @@ class NebuloidORM:
             new_key = Key(session=session_id, key=key_bytes)
             session.add(new_key)
             await self.tools.maybe_await(session.commit())
-            return new_key
+        self.key_cache.set(session_id, CachedKey(session_id, key_bytes, None, 0))
+        return new_key
 
     async def get_key(self, session_id: str):
+        if not session_id:
+            return None
+        if (cached := self.key_cache.get(session_id)) is not None:
+            return cached
+
         async with self.session_scope() as session:
             result = await self.tools.maybe_await(session.execute(
-                select(Key).where(Key.session == session_id)
+                select(Key.session, Key.key, Key.user_id, Key.logged_in).where(Key.session == session_id)
             ))
-            key_obj = result.scalar_one_or_none()  # returns Key instance or None
-            return key_obj
+            row = result.one_or_none()
+            if not row:
+                return None
+
+        key_obj = CachedKey(*row)
+        self.key_cache.set(session_id, key_obj)
+        return key_obj
 
     # Update existing key for a session
     async def update_key(self, session_id: str, key_bytes: bytes):
         async with self.session_scope() as session:
-            key_obj = await self.get_key(session_id)
-            if key_obj:
-                key_obj.key = key_bytes
-                key_obj.last_used = datetime.now()
-                session.add(key_obj)  # add is safe for updates in ORM
-                await self.tools.maybe_await(session.commit())
-                return key_obj
-            else:
+            result = await self.tools.maybe_await(session.execute(
+                update(Key)
+                .where(Key.session == session_id)
+                .values(key=key_bytes, last_used=datetime.now())
+            ))
+            if result.rowcount == 0:
+                self.key_cache.pop(session_id)
                 return None  # optionally handle missing session differently
+            await self.tools.maybe_await(session.commit())
+
+        if (cached := self.key_cache.peek(session_id)) is not None:
+            key_obj = cached._replace(key=key_bytes)
+            self.key_cache.set(session_id, key_obj)
+            return key_obj
+        return await self.get_key(session_id)
+
+    def cache_stats(self):
+        return {"session_keys": self.key_cache.stats()}
+
+    async def prune_key_cache(self):
+        """Drop cached keys whose auth_keys rows were removed by maintenance()."""
+        model = self.login_model
+        cached_sessions = self.key_cache.keys()
+        alive = set()
+        async with self.session_scope() as session:
+            for i in range(0, len(cached_sessions), 500):
+                chunk = cached_sessions[i:i + 500]
+                result = await self.tools.maybe_await(session.execute(
+                    select(model.session).where(model.session.in_(chunk))
+                ))
+                alive.update(row[0] for row in result.fetchall())
+
+        for session_id in cached_sessions:
+            if session_id not in alive:
+                self.key_cache.pop(session_id)
     
     # * Background loop for cleaning up old sessions.
     async def maintenance_task(self):
+        last_roles_load = asyncio.get_running_loop().time()
         while True:
             try:
+                if asyncio.get_running_loop().time() - last_roles_load >= self.roles_refresh:
+                    await self.load_roles()
+                    last_roles_load = asyncio.get_running_loop().time()
+
                 async with self.session_scope() as db:
                     await self.tools.maybe_await(db.execute(text("CALL maintenance()")))
+                    if self.login_model is Login:
+                        # refresh_login() keeps active sessions' rows fresh; tickets
+                        # not refreshed for ticket_ttl are rejected anyway
+                        await self.tools.maybe_await(db.execute(
+                            delete(Login).where(Login.last_used < datetime.now() - timedelta(seconds=self.ticket_ttl))
+                        ))
                     await self.tools.maybe_await(db.commit())
 
+                await self.prune_key_cache()
+
             except Exception as e:
                 print("Maintenance error:", e)
 
@@ -159,6 +259,16 @@ class NebuloidORM:
             await self.tools.maybe_await(session.refresh(new_user))  # ensures new_user.id is available
             return new_user
 
+    async def update_user_password(self, user_id: int, password_hash: str):
+        async with self.session_scope() as session:
+            result = await self.tools.maybe_await(session.execute(
+                update(User)
+                .where(User.id == user_id)
+                .values(password_hash=password_hash)
+            ))
+            await self.tools.maybe_await(session.commit())
+            return result.rowcount > 0
+
     # Fetch user by username
     async def get_user_by_username(self, username: str):
         async with self.session_scope() as session:
@@ -169,6 +279,23 @@ class NebuloidORM:
             return user_obj    
 
 
+    async def load_roles(self):
+        """(Re)load the roles table into the in-memory id -> name map."""
+        async with self.session_scope() as session:
+            result = await self.tools.maybe_await(session.execute(select(Role.id, Role.name)))
+            self.roles = {role_id: name for role_id, name in result.fetchall()}
+        self.roles_loaded_at = time.monotonic()
+        return self.roles
+
+    async def get_role_name(self, role_id):
+        if role_id is None:
+            return None
+        if role_id not in self.roles:
+            # maybe a role added since the last refresh; a bad id must not rescan the table on every request
+            if self.roles_loaded_at is None or time.monotonic() - self.roles_loaded_at >= self.roles_miss_interval:
+                await self.load_roles()
+        return self.roles.get(role_id)
+
     async def get_user_access_data(self, session_id: str):
       #Check auth_keys row by session_id.
        #If logged_in=1, then fetch role from users table.
@@ -177,49 +304,43 @@ class NebuloidORM:
         if not session_id:
             return None, {"status": "error", "logged_in": False, "message": "No session id"}
 
+        # Single round trip; users.role is read every time so role changes apply at once: auth_keys (or auth_logins) joined with users
+        model = self.login_model
+        columns = [model.user_id, model.logged_in, User.role]
+        if model is Key:
+            columns.append(Key.key)
         async with self.session_scope() as session:
-            # Step 1: Find row in auth_keys
             result = await self.tools.maybe_await(session.execute(
-                select(Key.user_id, Key.logged_in).where(Key.session == session_id)
+                select(*columns)
+                .outerjoin(User, User.id == model.user_id)
+                .where(model.session == session_id)
             ))
             row = result.one_or_none()
 
-            if not row:
-                return None, {"status": "error", "logged_in": False, "message": "Session not found"}
+        if not row:
+            self.key_cache.pop(session_id)
+            return None, {"status": "error", "logged_in": False, "message": "Session not found"}
 
-            user_id, logged_in = row
+        user_id, logged_in, role_id, *key_bytes = row
+        self.key_cache.set(session_id, CachedKey(session_id, key_bytes[0] if key_bytes else None, user_id, logged_in))
 
-            # Step 2: Check if logged_in == 1
-            if logged_in != 1:
-                return None, {"status": "error", "logged_in": False, "message": "User not logged in"}
+        if logged_in != 1:
+            return None, {"status": "error", "logged_in": False, "message": "User not logged in"}
 
-            # Step 3: Get role from users table
-            user_result = await self.tools.maybe_await(session.execute(
-                select(User.role).where(User.id == user_id)
-            ))
-            user_row = user_result.one_or_none()
-
-            if not user_row:
-                return None, {"status": "error", "logged_in": False, "message": "User not found"}
-
-            role, = user_row  # unpack single column
+        if role_id is None:
+            return None, {"status": "error", "logged_in": False, "message": "User not found"}
 
-            role_result = await self.tools.maybe_await(session.execute(
-                select(Role.name).where(Role.id == role)
-            ))
-            role_row = role_result.one_or_none()
-
-            role, = role_row
-
-            # Step 4: Return as JSON
-            return user_id, {
-                "status": "success",
-                "role": role,
-                "logged_in": True,
-            }
+        return user_id, {
+            "status": "success",
+            "role": await self.get_role_name(role_id),
+            "logged_in": True,
+        }
 
     async def get_role(self, user_id: int):
         """Fetch role name for a given user_id."""
+        if user_id is None:
+            return None
+
         async with self.session_scope() as session:
             result = await self.tools.maybe_await(session.execute(
                 select(User.role).where(User.id == user_id)
@@ -228,47 +349,79 @@ class NebuloidORM:
             if not row:
                 return None
 
-            role_id, = row
-
-            role_result = await self.tools.maybe_await(session.execute(
-                select(Role.name).where(Role.id == role_id)
-            ))
-            role_row = role_result.one_or_none()
-            if not role_row:
-                return None
-
-            role_name, = role_row
-            return role_name
+        role_id, = row
+        return await self.get_role_name(role_id)
         
     async def update_user_login_status(self, session_id: str, user_id: int, logged_in: bool):
         """Update or insert login status for a session in auth_keys."""
         if not session_id:
             return False
 
+        model = self.login_model
+        state = 1 if logged_in else 0
+        if model is Login and not logged_in:
+            state = REVOKED
         async with self.session_scope() as session:
             # Try to update existing row
+            query = update(model).where(model.session == session_id)
+            if model is Login:
+                query = query.where(Login.logged_in != REVOKED)
             result = await self.tools.maybe_await(session.execute(
-                update(Key)
-                .where(Key.session == session_id)
-                .values(
+                query.values(
                     user_id=user_id,
-                    logged_in=1 if logged_in else 0,
+                    logged_in=state,
                     last_used=datetime.now()
                 )
             ))
 
             if result.rowcount == 0:
-                return False  # No rows updated, session_id not found
+                if model is Key or not logged_in:
+                    self.key_cache.pop(session_id)
+                    return False  # No rows updated, session_id not found
+                revoked = await self.tools.maybe_await(session.execute(
+                    select(Login.logged_in).where(Login.session == session_id)
+                ))
+                if revoked.one_or_none() is not None:
+                    self.key_cache.pop(session_id)
+                    return False
+                # ticket sessions get their login row on first login
+                session.add(Login(session=session_id, user_id=user_id, logged_in=1))
 
             await self.tools.maybe_await(session.commit())
-            return True
+
+        logged_in = state
+        if model is Login:
+            self.key_cache.set(session_id, CachedKey(session_id, None, user_id, logged_in))
+        elif (cached := self.key_cache.peek(session_id)) is not None:
+            self.key_cache.set(session_id, cached._replace(user_id=user_id, logged_in=logged_in))
+        return True
         
+    async def refresh_login(self, session_id: str):
+        """Push back the expiry of a ticket session's login row as its ticket is reissued.
+
+        Returns False when the session was revoked by a logout.
+        """
+        async with self.session_scope() as session:
+            result = await self.tools.maybe_await(session.execute(
+                update(Login)
+                .where(Login.session == session_id, Login.logged_in != REVOKED)
+                .values(last_used=datetime.now())
+            ))
+            if result.rowcount == 0:
+                # no row: a session that never logged in, nothing to refresh
+                existing = await self.tools.maybe_await(session.execute(
+                    select(Login.logged_in).where(Login.session == session_id)
+                ))
+                return existing.one_or_none() is None
+            await self.tools.maybe_await(session.commit())
+        return True
+
     async def get_user_profile(self, user_id=None, session_id=None):
         
         if user_id is None and session_id is not None:
             async with self.session_scope() as session:
                 result = await self.tools.maybe_await(session.execute(
-                    select(Key.user_id).where(Key.session == session_id)
+                    select(self.login_model.user_id).where(self.login_model.session == session_id)
                 ))
                 row = result.one_or_none()
                 if row:
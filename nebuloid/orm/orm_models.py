@@ -24,6 +24,19 @@ class Key(Base):
             f"logged_in={self.logged_in}, key={self.key.hex()[:8]}...)>"
         )
 
+class Login(Base):
+    # Login state for stateless session tickets; the AES key lives in the cookie
+    __tablename__ = "auth_logins"
+
+    session: Mapped[str] = mapped_column(String(100), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, nullable=True)
+    logged_in: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    last_used: Mapped[datetime] = mapped_column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<Login(session={self.session}, user_id={self.user_id}, logged_in={self.logged_in})>"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -1,19 +1,53 @@
 import sys
 import asyncio
+import contextvars
 import importlib.util
 from pathlib import Path
-from inspect import isawaitable
+from concurrent.futures import ThreadPoolExecutor
+from inspect import isawaitable, iscoroutinefunction
+from typing import Callable, NamedTuple, Optional
 import importlib.resources as pkg_resources
 
-from nebuloid.api.context import NebuloidContext
+from nebuloid.api.context import NebuloidContext, NebuloidUserLoader
+from nebuloid.manifest.manifest import thaw
+
+# sequential: in priority order, each awaited before the next
+# concurrent: all at once through gather, results still in priority order
+# fire_and_forget: scheduled in the background, hook() returns [] right away; under Flask
+#   the request's loop closes with the view, so there it runs inline like sequential
+HOOK_MODES = ("sequential", "concurrent", "fire_and_forget")
+
+class HookHandler(NamedTuple):
+    func: Callable
+    priority: int = 0                 # higher runs first, ties keep registration order
+    timeout: Optional[float] = None   # seconds; sync handlers then run in a worker thread
+    plugin: Optional[str] = None
+
+    @property
+    def name(self):
+        return getattr(self.func, "__qualname__", repr(self.func))
 
 class NebuloidPluginManager:
     def __init__(self, services):
         services.inject_services(self)
 
         self.plugins = {}
+        self.hook_modes = {}     # hook name -> one of HOOK_MODES, sequential when absent
+        self.dispatch = {}       # hook name -> handlers sorted by priority, rebuilt by register_hook()
+        self.background = set()  # running fire_and_forget hooks
+        # sync handlers with a timeout; not the loop's default executor, which a
+        # closing loop (Flask's per-request ones) would wait on for a stuck handler
+        self.executor = ThreadPoolExecutor(thread_name_prefix="nebuloid-hook")
 
     def mount(self):
+        # "hooks": {"on_request": "fire_and_forget", ...}
+        for hook_name, mode in self.manifest.data.get('hooks', {}).items():
+            if mode not in HOOK_MODES:
+                raise ValueError(f"Unknown mode '{mode}' for hook {hook_name}, expected one of {HOOK_MODES}")
+            self.hook_modes[hook_name] = mode
+            if mode == "fire_and_forget" and self.use_flask:
+                print(f"Hook {hook_name}: fire_and_forget runs inline under Flask, the request waits for it")
+
         self.plugins_dir = self.storage.dir("plugins")
         for plugin, value in self.manifest.data['plugins'].items():
             if plugin.startswith('_'):
@@ -42,30 +76,75 @@ class NebuloidPluginManager:
                 spec.loader.exec_module(module)
 
             if hasattr(module, 'mount'):
-                context = NebuloidContext(self.services, value)
+                # a plain copy: plugins may adjust their config, the manifest stays frozen
+                context = NebuloidContext(self.services, thaw(value))
                 context.plugin_name = plugin
                 self.plugins[plugin] = {"instance": module, "location": location}
                 module.mount(context)
             else:
                 print(f"Plugin {plugin} does not have a mount function.")
                 
-    async def hook(self, hook_name, user_id=None,*args, **kwargs):
-        context = NebuloidContext(self.services, args=args, kwargs=kwargs)
+    def register_hook(self, name, func, priority=0, timeout=None, plugin=None):
+        registry = self.manifest.plugin_registry.setdefault(name, [])
+        if any(handler.func == func for handler in registry):
+            raise ValueError(f"Function {func} already registered for hook {name}")
+        registry.append(HookHandler(func, priority, timeout, plugin))
+        # sorted() is stable, so equal priorities stay in registration order
+        self.dispatch[name] = tuple(sorted(registry, key=lambda handler: -handler.priority))
+
+    def handlers(self, hook_name):
+        return self.dispatch.get(hook_name, ())
+
+    async def call(self, handler, context):
+        await context.prepare(handler.func)
+        if handler.timeout is None:
+            result = handler.func(context)
+            return await result if isawaitable(result) else result
+
+        if iscoroutinefunction(handler.func):
+            pending = handler.func(context)
+        else:
+            # a blocking handler can only be timed out from outside its thread; the
+            # thread itself can't be stopped and finishes in the background
+            async def run_sync():
+                run = contextvars.copy_context().run
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, run, handler.func, context)
+                return await result if isawaitable(result) else result
+            pending = run_sync()
+        try:
+            return await asyncio.wait_for(pending, handler.timeout)
+        except asyncio.TimeoutError:
+            print(f"Hook handler {handler.name} ({handler.plugin}) timed out after {handler.timeout}s")
+            return None
+
+    async def hook(self, hook_name, user_id=None,*args, user=None, **kwargs):
+        handlers = self.dispatch.get(hook_name)
+        if not handlers:
+            return []  # nothing registered: no context, no profile lookup
+
+        # user: the request's NebuloidUserLoader, so the profile is loaded once per request
+        if user is None and user_id is not None:
+            user = NebuloidUserLoader(self.orm, user_id=user_id)
+        context = NebuloidContext(self.services, args=args, kwargs=kwargs, user=user)
+
+        mode = self.hook_modes.get(hook_name, "sequential")
+        if mode == "concurrent":
+            return list(await asyncio.gather(*(self.call(handler, context) for handler in handlers)))
+        if mode == "fire_and_forget" and not self.use_flask:
+            # Flask closes the request's loop with the view, so there it is awaited like sequential
+            task = asyncio.ensure_future(self.run_background(hook_name, handlers, context))
+            self.background.add(task)
+            task.add_done_callback(self.background.discard)
+            return []
+
         results = []
-        if user_id is not None:
-            resp = await self.orm.get_user_profile(user_id=user_id)
-            context.user = resp.get("data", [{}])[0]
-
-        for func in self.manifest.plugin_registry.get(hook_name, []):
-            result = func(context)
-            if isawaitable(result):
-                try:
-                    loop = asyncio.get_running_loop()
-                    # if a loop is running, schedule it as a task and wait for it
-                    result = await asyncio.create_task(result)
-                except RuntimeError:
-                    # no running loop, safe to use await directly
-                    result = await result
-            results.append(result)
+        for handler in handlers:
+            results.append(await self.call(handler, context))
         return results
-    
\ No newline at end of file
+
+    async def run_background(self, hook_name, handlers, context):
+        for handler in handlers:
+            try:
+                await self.call(handler, context)
+            except Exception as e:
+                print(f"Hook {hook_name} error in {handler.name}: {e}")
@@ -1,19 +1,21 @@
 import * as tools from '/utils_tools.js';
 
 async function auth_init() {
-  await tools.api_send("auth", { info: "request_data", data : "auth_params"});
+  await tools.api_call("auth", { info: "request_data", data : "auth_params"});
 }
 
 
 async function authorize(username, password) {
-  return await tools.api_send("auth", { info: "authorize", username: username, password: password });
+  return await tools.api_call("auth", { info: "authorize", username: username, password: password });
 }
 
 async function signup(username, password) {
-  return await tools.api_send("auth", { info: "signup", username: username, password: password });
+  return await tools.api_call("auth", { info: "signup", username: username, password: password });
 }
 async function logout() {
+  // over HTTP: with session tickets the reply carries the new session cookie
   const result = await tools.api_send("auth", { info: "logout" });
+  tools.close_socket();  // reconnect with that cookie
   return result.status === "success";
 }
 window.auth_init = auth_init;
@@ -1,16 +1,26 @@
 import { pem } from '/utils_pem.js';
 export let aesKey = null;
+export const BINARY_MIME = 'application/octet-stream';
 
-export async function api_send(api_name, request_data) {
+let handshaking = null;
 
+// Make sure a session key exists, running the RSA handshake on first use
+export async function ensure_key() {
   // check presence
   if (is_key_present()) {
-    const aesKey = await get_key();
-  } else {
-    try {
+    aesKey = await get_key();
+    return aesKey;
+  }
+  // concurrent first calls share a single handshake
+  handshaking ??= handshake().finally(() => { handshaking = null; });
+  return await handshaking;
+}
+
+async function handshake() {
+  try {
     // Generate AES key once
-    aesKey = await generateAESKey();
-    const aesKeyB64 = await exportAESKey(aesKey);
+    const key = await generateAESKey();
+    const aesKeyB64 = await exportAESKey(key);
 
     // First handshake request
     const request_data = { info: "init_com", key: aesKeyB64 };
@@ -28,50 +38,51 @@ export async function api_send(api_name, request_data) {
     const result = await response.json();
 
     // Decrypt response from backend (expecting { data: "..." })
-    const decrypted = await aesDecrypt(aesKey, result);
+    const decrypted = await aesDecrypt(key, result);
 
     console.log("Init response decrypted:", decrypted);
 
+    // only publish the key once the server knows it
+    await store_key(key);
   } catch (error) {
     console.error('Error during init:', error);
   }
-  }
+  return aesKey;
+}
 
-  // console.log("Key:", new Uint8Array(await crypto.subtle.exportKey("raw", aesKey)));
+function invalid_session() {
+  sessionStorage.clear();
+  aesKey = null;
+  alert("Something went wrong, Please refresh\nError:Session deleted!");
+}
+
+export async function api_send(api_name, request_data) {
+
+  await ensure_key();
 
   try {
     if (!aesKey) {
       throw new Error("AES key not initialized yet. Run init first.");
     }
 
-    // Prepare request
-    // const request_data = { info: "request_data", data : "auth_params"};
-
-    await store_key(aesKey);
-
-    // Encrypt with AES
-    const encrypted = await aesEncrypt(aesKey, JSON.stringify(request_data));
+    // Encrypt with AES, sent as a binary frame (nonce + ciphertext)
+    const frame = await aesSeal(aesKey, JSON.stringify(request_data));
 
     // Send to backend
     const response = await fetch(`/api_${api_name}`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ data: encrypted })
+      headers: { 'Content-Type': BINARY_MIME },
+      body: frame
     });
 
-    const result = await response.json();
-
-    console.log(`Result fromf /api_${api_name}:`, result, typeof(result));
-
-    if(result?.error ?? null == 'invalid_session') {
-      sessionStorage.clear();
-      alert("Something went wrong, Please refresh\nError:Session deleted!");
+    if (response.status === 403) {
+      const result = await response.json();
+      if (result?.error === 'invalid_session') invalid_session();
+      return result;
     }
 
     // Decrypt response
-    const decrypted = await aesDecrypt(aesKey, result);
-
-    console.log("Authorize response decrypted:", decrypted);
+    const decrypted = await aesOpen(aesKey, await response.arrayBuffer());
 
     return JSON.parse(decrypted);
 
@@ -80,6 +91,121 @@ export async function api_send(api_name, request_data) {
   }
 }
 
+// --- Persistent WebSocket transport (/api_ws), falls back to api_send ---
+let ws_enabled = false;
+let socket = null;
+let socket_opening = null;
+let next_call_id = 1;
+const ws_pending = new Map();
+
+export function enable_ws() {
+  ws_enabled = !!window.WebSocket;
+}
+
+function open_socket(key) {
+  return new Promise((resolve) => {
+    const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/api_ws`);
+    ws.binaryType = 'arraybuffer';
+    let opened = false;
+
+    ws.onopen = () => { opened = true; resolve(ws); };
+    ws.onmessage = async (event) => {
+      const reply = JSON.parse(await aesOpen(key, event.data));
+      const call = ws_pending.get(reply.id);
+      if (call) {
+        ws_pending.delete(reply.id);
+        call.resolve(reply.data);
+      }
+    };
+    ws.onclose = () => {
+      if (socket === ws) socket = null;
+      // a socket that never opened means no ws support here: stay on HTTP
+      if (!opened) ws_enabled = false;
+      for (const [id, call] of ws_pending) {
+        if (call.socket === ws) {
+          ws_pending.delete(id);
+          call.retry();
+        }
+      }
+      resolve(null);
+    };
+  });
+}
+
+// Drop the socket, the next call opens one with the current session cookie
+export function close_socket() {
+  if (socket) socket.close();
+  socket = null;
+}
+
+async function get_socket() {
+  if (socket && socket.readyState === WebSocket.OPEN) return socket;
+  const key = await ensure_key();
+  if (!key) return null;
+  socket_opening ??= open_socket(key).then((ws) => { socket = ws; socket_opening = null; return ws; });
+  return await socket_opening;
+}
+
+// Preferred entry point: one multiplexed socket when available, HTTP otherwise
+export async function api_call(api_name, request_data) {
+  if (!ws_enabled) return await api_send(api_name, request_data);
+
+  const ws = await get_socket();
+  if (!ws) return await api_send(api_name, request_data);
+
+  const id = next_call_id++;
+  return await new Promise(async (resolve) => {
+    ws_pending.set(id, { socket: ws, resolve, retry: () => api_send(api_name, request_data).then(resolve) });
+    ws.send(await aesSeal(aesKey, JSON.stringify({ id: id, api: api_name, data: request_data })));
+  });
+}
+
+// Call a streaming portal function; yields each chunk as the server produces it
+export async function* api_stream(request_data) {
+  await ensure_key();
+  if (!aesKey) {
+    throw new Error("AES key not initialized yet. Run init first.");
+  }
+
+  const response = await fetch('/api_stream', {
+    method: 'POST',
+    headers: { 'Content-Type': BINARY_MIME },
+    body: await aesSeal(aesKey, JSON.stringify(request_data))
+  });
+
+  if (response.status === 403) {
+    const result = await response.json();
+    if (result?.error === 'invalid_session') invalid_session();
+    throw new Error(result?.error ?? "stream refused");
+  }
+
+  // frames: 4 byte big-endian length, then nonce + ciphertext
+  const reader = response.body.getReader();
+  let buffer = new Uint8Array(0);
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    const joined = new Uint8Array(buffer.length + value.length);
+    joined.set(buffer, 0);
+    joined.set(value, buffer.length);
+    buffer = joined;
+
+    while (buffer.length >= 4) {
+      const size = new DataView(buffer.buffer, buffer.byteOffset, 4).getUint32(0);
+      if (buffer.length < 4 + size) break;
+
+      const message = JSON.parse(await aesOpen(aesKey, buffer.slice(4, 4 + size)));
+      buffer = buffer.slice(4 + size);
+
+      if (message.status === "done") return;
+      if (message.status === "error") throw new Error(message.message ?? "stream error");
+      yield message.chunk;
+    }
+  }
+  throw new Error("stream ended unexpectedly");
+}
+
 export async function importAESKey(keyB64) {
   const raw = base64ToArrayBuffer(keyB64); // convert base64 → ArrayBuffer
   return await crypto.subtle.importKey(
@@ -188,6 +314,28 @@ export async function aesEncrypt(aesKey, plaintext) {
     };
 }
 
+// Binary wire format: 12 byte nonce followed by the raw ciphertext
+export async function aesSeal(aesKey, plaintext) {
+  const nonce = crypto.getRandomValues(new Uint8Array(12));
+  const encoded = typeof plaintext === 'string' ? new TextEncoder().encode(plaintext) : plaintext;
+  const ciphertext = await crypto.subtle.encrypt({ name: "AES-GCM", iv: nonce }, aesKey, encoded);
+
+  const frame = new Uint8Array(12 + ciphertext.byteLength);
+  frame.set(nonce, 0);
+  frame.set(new Uint8Array(ciphertext), 12);
+  return frame;
+}
+
+export async function aesOpen(aesKey, frame) {
+  const bytes = new Uint8Array(frame);
+  const decrypted = await crypto.subtle.decrypt(
+    { name: "AES-GCM", iv: bytes.subarray(0, 12) },
+    aesKey,
+    bytes.subarray(12)
+  );
+  return new TextDecoder().decode(decrypted);
+}
+
 export async function store_key(key) {
   aesKey = key;
   const keyB64 = await exportAESKey(key);
@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """A minimal Nebuloid project in a temporary directory: one `home` route and a sqlite database."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    (tmp_path / "nucleus").mkdir()
+    (tmp_path / "nucleus" / "private_key.pem").write_bytes(key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    (tmp_path / "nucleus" / "public_key.pem").write_bytes(key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+    for name in ("utils", "plugins", "cache", "bytecode"):
+        (tmp_path / "nucleus" / name).mkdir()
+
+    manifest = {
+        "server": {"base_url": "http://localhost", "routes": {"/": "home"}, "watch_interval": 0},
+        "db": {"cred": {"db_type": "sqlite", "database": str(tmp_path / "db.sqlite")}},
+        "auth": {"mode": "password", "login_url": "/login"},
+        "api": {"session_mode": "db"},
+        "plugins": {}
+    }
+    write(tmp_path / "nucleus" / "manifest.neb", json.dumps(manifest))
+    write(tmp_path / "pages" / "home" / "recipe.yaml", "page:\n  template: index.html\n")
+    write(tmp_path / "pages" / "home" / "index.html", "<p>home</p>")
+    write(tmp_path / "pages" / "home" / "static" / "app.css", "body { color: red; }\n" * 20)
+    write(tmp_path / "pages" / "404" / "recipe.yaml", "page:\n  template: index.html\n")
+    write(tmp_path / "pages" / "404" / "index.html", "<p>not found</p>")
+    (tmp_path / "shared").mkdir()
+
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def make_app(project):
+    """Build the Flask app of `project`; manifest changes go in before calling it."""
+    from nebuloid import Nebuloid
+
+    def make(**manifest):
+        path = project / "nucleus" / "manifest.neb"
+        data = json.loads(path.read_text())
+        for section, values in manifest.items():
+            data.setdefault(section, {}).update(values)
+        path.write_text(json.dumps(data))
+
+        app = Nebuloid(use_flask=True)
+        app.wsgi
+        return app
+    return make
@@ -0,0 +1,73 @@
+import pytest
+
+from nebuloid.core.access import NebuloidAccess
+from nebuloid.core.services import NebuloidServices
+from nebuloid.manifest.manifest import freeze
+
+ROUTES = {"/": "home", "/admin": "admin", "/staff": "staff", "/me": "me", "/any": "any"}
+RULES = {
+    "admin": "access:\n  roles_allowed: admin\n",
+    "staff": "access:\n  login_required: true\n  roles_allowed: [admin, editor]\n",
+    "me": "access:\n  login_required: true\n",
+    "any": "access:\n  roles_allowed: '*'\n",
+}
+
+@pytest.fixture
+def access(tmp_path):
+    for route_name, text in RULES.items():
+        (tmp_path / route_name).mkdir()
+        (tmp_path / route_name / "access.yaml").write_text(text)
+    manifest = type("Manifest", (), {"data": freeze({"server": {"routes": ROUTES}})})()
+    access = NebuloidAccess(NebuloidServices(manifest=manifest), str(tmp_path))
+    access.mount()
+    return access
+
+def allowed(access, route_name, role=None, logged_in=False):
+    return access.can_access(route_name, {"role": role, "logged_in": logged_in})[0]
+
+def test_route_without_rules_is_open(access):
+    assert access.table.policies["home"].open
+    assert allowed(access, "home")
+    assert allowed(access, "unknown")
+
+def test_role_masks(access):
+    policies = access.table.policies
+    assert policies["staff"].role_mask & policies["admin"].role_mask  # the admin bit is shared
+    assert bin(policies["staff"].role_mask).count("1") == 2
+
+    assert allowed(access, "admin", "admin", True)
+    assert not allowed(access, "admin", "editor", True)
+    assert allowed(access, "staff", "editor", True)
+    assert not allowed(access, "staff", "viewer", True)
+    assert not allowed(access, "admin", None, False)
+
+def test_login_required(access):
+    assert access.can_access("me", {"logged_in": False}) == (False, "login_required")
+    assert allowed(access, "me", "viewer", True)
+    assert access.can_access("staff", {"role": "admin", "logged_in": False}) == (False, "login_required")
+
+def test_any_role(access):
+    assert allowed(access, "any", "whoever")
+    assert allowed(access, "any")
+
+def test_decisions_are_memoized_and_bounded(access):
+    access.max_decisions = 3
+    for role in ("a", "b", "c"):
+        allowed(access, "admin", role, True)
+    assert len(access.table.decisions) == 3
+    allowed(access, "admin", "d", True)
+    assert len(access.table.decisions) == 1
+    assert access.can_access("admin", {"role": "admin", "logged_in": True}) == (True, "Access granted")
+
+def test_reloaded_table_numbers_its_own_roles(access, tmp_path):
+    served = access.table
+    bits = dict(served.role_ids)
+    (tmp_path / "admin" / "access.yaml").write_text("access:\n  roles_allowed: [auditor, editor]\n")
+    table = access.compile_table(ROUTES)
+    assert served.role_ids == bits  # the table being served is untouched
+    assert allowed(access, "admin", "admin", True)
+
+    access.table = table
+    assert not allowed(access, "admin", "admin", True)
+    assert allowed(access, "admin", "auditor", True)
+    assert allowed(access, "staff", "admin", True)
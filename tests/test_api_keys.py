@@ -0,0 +1,64 @@
+import asyncio
+import json
+import os
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from sqlalchemy import text
+
+from nebuloid.api.api import aes_decrypt, aes_encrypt
+
+AUTH_KEYS = ("CREATE TABLE auth_keys (id INTEGER PRIMARY KEY AUTOINCREMENT, session VARCHAR(100) UNIQUE, user_id INTEGER, "
+             "logged_in INTEGER DEFAULT 0, key BLOB, created_at DATETIME, last_used DATETIME)")
+
+def setup(make_app):
+    app = make_app()
+
+    @app.portal
+    def hello(ctx):
+        return {"hello": ctx.args[0]}
+
+    with app.orm.engine.begin() as connection:
+        connection.execute(text(AUTH_KEYS))
+    return app
+
+def call(client, session_id, key):
+    body = aes_encrypt(AESGCM(key), json.dumps({"name": "hello", "args": ["you"]}).encode())
+    client.set_cookie("session_id", session_id)
+    return client.post("/api_data", data=json.dumps({"data": body}), content_type="application/json")
+
+def test_key_changed_by_another_worker_is_reloaded(make_app):
+    app = setup(make_app)
+    client = app.app.test_client()
+    old, new = os.urandom(32), os.urandom(32)
+    asyncio.run(app.orm.add_key("s1", old))  # cached by this worker
+
+    # another worker re-handshakes the session: the row changes, this worker's cache doesn't
+    with app.orm.engine.begin() as connection:
+        connection.execute(text("UPDATE auth_keys SET key = :key WHERE session = 's1'"), {"key": new})
+    assert app.orm.key_cache.peek("s1").key == old
+
+    response = call(client, "s1", new)
+    assert response.status_code == 200
+    assert json.loads(aes_decrypt(AESGCM(new), response.get_json()))["result"] == {"hello": "you"}
+    assert app.orm.key_cache.peek("s1").key == new
+
+    # the cached key is still used as long as it works
+    assert call(client, "s1", new).status_code == 200
+
+def test_undecryptable_request_is_an_invalid_session(make_app):
+    app = setup(make_app)
+    client = app.app.test_client()
+    asyncio.run(app.orm.add_key("s1", os.urandom(32)))
+
+    response = call(client, "s1", os.urandom(32))
+    assert response.status_code == 403
+    assert response.get_json() == {"error": "invalid_session"}
+
+def test_ticket_cookie_lives_as_long_as_the_ticket(make_app):
+    from flask import Response
+
+    app = make_app(api={"session_mode": "ticket", "ticket_ttl": 86400})
+    api = app.server.api
+    response = Response()
+    api.set_session_cookie(response, api.issue_ticket(api.new_ticket_session(), os.urandom(32)))
+    assert "Max-Age=86400" in response.headers["Set-Cookie"]
@@ -0,0 +1,36 @@
+from nebuloid.builder.assets import js_line_states, minify_js
+
+def test_indentation_and_comments_are_dropped():
+    text = "function f(a) {\n    // note\n    /* block\n       comment */\n    return a / 2;  \n}\n\n"
+    assert minify_js(text) == "function f(a) {\nreturn a / 2;\n}\n"
+
+def test_backtick_in_a_regex_does_not_open_a_template():
+    text = (
+        "const tick = /`/g;\n"
+        "const html = `\n"
+        "    <div>\n"
+        "        ${items.map(i => `<b>${i}</b>`).join(`\n`)}\n"
+        "    </div>`;\n"
+        "    const after = 1;\n"
+    )
+    assert minify_js(text) == (
+        "const tick = /`/g;\n"
+        "const html = `\n"
+        "    <div>\n"
+        "        ${items.map(i => `<b>${i}</b>`).join(`\n`)}\n"
+        "    </div>`;\n"
+        "const after = 1;\n"
+    )
+
+def test_backticks_in_strings_and_comments_are_ignored():
+    text = "const a = '`', b = \"`\"; // `\n/* ` */\nconst c = `\n  x`;\n  const d = a.split(/[/`]/);\n"
+    assert minify_js(text) == "const a = '`', b = \"`\"; // `\nconst c = `\n  x`;\nconst d = a.split(/[/`]/);\n"
+
+def test_division_is_not_read_as_a_regex():
+    text = "const r = (a) / 2 / b;\nconst s = `\n  kept`;\n"
+    assert minify_js(text) == "const r = (a) / 2 / b;\nconst s = `\n  kept`;\n"
+
+def test_text_that_cannot_be_followed_is_left_alone():
+    text = "const s = `open\n    never closed;\n"
+    assert js_line_states(text) is None
+    assert minify_js(text) == text
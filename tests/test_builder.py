@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+from nebuloid.builder.builder import fill_params
+from nebuloid.manifest.manifest import freeze
+
+def test_fill_params_substitutes_placeholders():
+    args = freeze({"id": "{id}", "label": "item {id}", "keep": "{other}", "list": ["{id}", 1]})
+    assert fill_params(args, {"id": 7}) == {"id": 7, "label": "item 7", "keep": "{other}", "list": [7, 1]}
+
+def test_fill_params_never_returns_frozen_data():
+    args = freeze({"filters": {"tags": ["a", "b"]}, "limit": 5})
+    for params in (None, {}, {"id": 1}):
+        filled = fill_params(args, params)
+        assert type(filled) is dict and type(filled["filters"]) is dict and type(filled["filters"]["tags"]) is list
+        json.dumps(filled)
+    assert fill_params(freeze(["x"]), None) == ["x"]
+    assert fill_params("plain", None) == "plain"
+
+def test_data_hooks_get_plain_sources(make_app, project):
+    (project / "pages" / "home" / "recipe.yaml").write_text(
+        "page:\n  template: index.html\n"
+        "data:\n  sources:\n    - name: greeting\n      type: portal\n      portal_name: greet\n      args: {names: [a, b]}\n"
+    )
+    app = make_app()
+    seen = {}
+
+    @app.portal
+    def greet(ctx):
+        seen["args"] = json.dumps(ctx.args)
+        return {"ok": True}
+
+    def before(ctx):
+        seen["sources"] = json.dumps(ctx.kwargs["sources"])
+    app.plugins.register_hook("before_get_data", before)
+
+    assert app.app.test_client().get("/").status_code == 200
+    assert json.loads(seen["args"]) == {"names": ["a", "b"]}
+    assert json.loads(seen["sources"])[0]["name"] == "greeting"
+
+def test_plan_is_resolved_once_per_request(make_app, project):
+    (project / "pages" / "home" / "recipe.yaml").write_text("page:\n  template: index.html\n  stream: true\n")
+    app = make_app()
+    builder = app.server.builder
+    calls = []
+    get_plan = builder.get_plan
+    builder.get_plan = lambda route_name: calls.append(route_name) or get_plan(route_name)
+
+    client = app.app.test_client()
+    response = client.get("/")
+    assert response.status_code == 200 and b"home" in response.data
+    assert calls == ["home"]
+
+    (project / "pages" / "home" / "recipe.yaml").write_text("page:\n  template: index.html\n")
+    calls.clear()
+    assert client.get("/").status_code == 200
+    assert calls == ["home"]
+
+def test_cached_page_reuses_the_request_role(make_app, project):
+    (project / "pages" / "home" / "recipe.yaml").write_text(
+        "page:\n  template: index.html\n  cache: {ttl: 60}\n"
+        "data:\n  sources:\n    - name: greeting\n      type: portal\n      portal_name: greet\n      cache: {ttl: 60, scope: role}\n"
+    )
+    app = make_app()
+    calls = []
+
+    @app.portal
+    def greet(ctx):
+        return {"ok": True}
+
+    async def get_role(user_id):
+        calls.append(user_id)
+    app.orm.get_role = get_role
+
+    client = app.app.test_client()
+    for _ in range(2):
+        assert client.get("/").status_code == 200
+    assert calls == []
+    assert len(app.server.builder.page_cache) == 1
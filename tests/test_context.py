@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from nebuloid.api.context import NebuloidContext, NebuloidUserLoader, skip_user
+from nebuloid.core.services import NebuloidServices
+
+def test_services_are_frozen_once_ready(make_app):
+    app = make_app()
+    with pytest.raises(RuntimeError):
+        app.services.add(late=object())
+    assert app.services.get("late") is None
+
+def test_services_can_be_added_before_freezing():
+    services = NebuloidServices(orm="orm")
+    services.add(builder="builder")
+    with pytest.raises(ValueError):
+        services.add(builder="again")
+    services.freeze()
+    with pytest.raises(RuntimeError):
+        services.add(api="api")
+    assert services.get("builder") == "builder"
+
+def test_context_reads_services_and_keeps_only_its_own_state():
+    services = NebuloidServices(orm="orm", _private="hidden")
+    ctx = NebuloidContext(services, args=(1,), kwargs={"a": 2})
+    assert ctx.orm == "orm"
+    assert ctx.args == (1,) and ctx.kwargs == {"a": 2}
+    with pytest.raises(AttributeError):
+        ctx._private
+    with pytest.raises(AttributeError):
+        ctx.missing
+    with pytest.raises(AttributeError):
+        ctx.counter = 1  # slots only, see the NebuloidContext docstring
+    assert not hasattr(ctx, "__dict__")
+
+class Orm:
+    def __init__(self, user=None):
+        self.user = user
+        self.loads = 0
+
+    async def get_user_profile(self, session_id=None, user_id=None):
+        self.loads += 1
+        return {"status": "success", "data": [self.user] if self.user else []}
+
+def test_guest_gets_the_guest_value():
+    orm = Orm()
+    ctx = NebuloidContext(NebuloidServices(), user=NebuloidUserLoader(orm, user_id=None), guest={})
+
+    async def run():
+        await ctx.prepare(lambda ctx: None)
+        return ctx.user, await ctx.get_user()
+    assert asyncio.run(run()) == ({}, {})
+
+def test_user_is_loaded_unless_skipped():
+    orm = Orm({"user_id": 7})
+
+    @skip_user
+    def handler(ctx):
+        return None
+
+    async def run():
+        ctx = NebuloidContext(NebuloidServices(), user=NebuloidUserLoader(orm, user_id=7), guest={})
+        await ctx.prepare(handler)
+        assert orm.loads == 0
+        await ctx.prepare(lambda ctx: None)
+        return ctx.user
+    assert asyncio.run(run()) == {"user_id": 7}
+    assert orm.loads == 1
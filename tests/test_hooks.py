@@ -0,0 +1,107 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from nebuloid.core.services import NebuloidServices
+from nebuloid.manifest.manifest import freeze
+from nebuloid.plugins import NebuloidPluginManager
+
+def manager(hooks=None, use_flask=False):
+    manifest = type("Manifest", (), {"data": freeze({"hooks": hooks or {}, "plugins": {}}), "plugin_registry": {}})()
+    storage = type("Storage", (), {"dir": lambda self, name: None})()
+    plugins = NebuloidPluginManager(NebuloidServices(manifest=manifest, storage=storage, orm=None, use_flask=use_flask))
+    plugins.mount()
+    return plugins
+
+def test_handlers_run_by_priority_then_registration_order():
+    plugins = manager()
+    for name, priority in (("a", 0), ("b", 5), ("c", 0), ("d", 5), ("e", -1)):
+        plugins.register_hook("render_page", lambda ctx, name=name: name, priority=priority)
+    assert asyncio.run(plugins.hook("render_page")) == ["b", "d", "a", "c", "e"]
+
+def test_handler_registered_twice_is_rejected():
+    plugins = manager()
+    def handler(ctx):
+        return 1
+    plugins.register_hook("render_page", handler)
+    with pytest.raises(ValueError):
+        plugins.register_hook("render_page", handler, priority=3)
+
+def test_hook_arguments_reach_the_context():
+    plugins = manager()
+    plugins.register_hook("on_request", lambda ctx: (ctx.kwargs["path"], ctx.args))
+    assert asyncio.run(plugins.hook("on_request", None, 1, 2, path="/x")) == [("/x", (1, 2))]
+
+def test_async_handler_timeout_yields_none():
+    plugins = manager()
+    async def slow(ctx):
+        await asyncio.sleep(1)
+        return "slow"
+    async def fast(ctx):
+        return "fast"
+    plugins.register_hook("render_page", slow, timeout=0.05)
+    plugins.register_hook("render_page", fast, timeout=0.05)
+
+    started = time.monotonic()
+    assert asyncio.run(plugins.hook("render_page")) == [None, "fast"]
+    assert time.monotonic() - started < 0.5
+
+def test_sync_handler_timeout_yields_none():
+    plugins = manager()
+    release = threading.Event()
+    def blocking(ctx):
+        release.wait(2)
+        return "blocking"
+    plugins.register_hook("render_page", blocking, timeout=0.05)
+    plugins.register_hook("render_page", lambda ctx: threading.current_thread().name, timeout=1)
+    plugins.register_hook("render_page", lambda ctx: threading.current_thread().name)
+
+    started = time.monotonic()
+    results = asyncio.run(plugins.hook("render_page"))
+    release.set()
+    assert time.monotonic() - started < 1
+    assert results[0] is None
+    assert results[1] != threading.current_thread().name  # timed: in a worker thread
+    assert results[2] == threading.current_thread().name  # untimed: inline
+
+def test_concurrent_mode_keeps_priority_order():
+    plugins = manager({"render_page": "concurrent"})
+    async def late(ctx):
+        await asyncio.sleep(0.05)
+        return "late"
+    async def early(ctx):
+        return "early"
+    plugins.register_hook("render_page", early)
+    plugins.register_hook("render_page", late, priority=1)
+    assert asyncio.run(plugins.hook("render_page")) == ["late", "early"]
+
+def test_fire_and_forget_returns_right_away():
+    plugins = manager({"on_request": "fire_and_forget"})
+    done = []
+    async def handler(ctx):
+        await asyncio.sleep(0.01)
+        done.append(1)
+    async def failing(ctx):
+        raise RuntimeError("boom")
+    plugins.register_hook("on_request", failing, priority=1)
+    plugins.register_hook("on_request", handler)
+
+    async def run():
+        assert await plugins.hook("on_request") == []
+        assert done == []
+        await asyncio.gather(*plugins.background)
+        return done
+    assert asyncio.run(run()) == [1]
+
+def test_fire_and_forget_runs_inline_under_flask():
+    plugins = manager({"on_request": "fire_and_forget"}, use_flask=True)
+    done = []
+    plugins.register_hook("on_request", lambda ctx: done.append(1))
+    asyncio.run(plugins.hook("on_request"))
+    assert done == [1]
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        manager({"on_request": "eventually"})
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from nebuloid.builder.http import NebuloidHTTPClient, cache_lifetime
+
+class StandIn(BaseHTTPRequestHandler):
+    """Local stand-in for a REST data source."""
+    hits = []
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        StandIn.hits.append((self.path, self.headers.get("If-None-Match")))
+        if self.path.startswith("/slow"):
+            with StandIn.lock:
+                StandIn.active += 1
+                StandIn.peak = max(StandIn.peak, StandIn.active)
+            time.sleep(0.05)
+            with StandIn.lock:
+                StandIn.active -= 1
+
+        if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Cache-Control", "max-age=0")
+            self.end_headers()
+            return
+
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/etag":
+            self.send_header("ETag", '"v1"')
+            self.send_header("Cache-Control", "max-age=0")
+        elif self.path == "/fresh":
+            self.send_header("Cache-Control", "max-age=60")
+        else:
+            self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+@pytest.fixture(autouse=True)
+def reset():
+    StandIn.hits = []
+    StandIn.peak = 0
+
+def test_cache_lifetime():
+    assert cache_lifetime({"cache-control": "no-store"}) is None
+    assert cache_lifetime({"cache-control": "no-cache"}) == 0
+    assert cache_lifetime({"cache-control": "public, max-age=30"}) == 30
+    assert cache_lifetime({"cache-control": "max-age=30, s-maxage=5"}) == 5
+    assert cache_lifetime({}) == 0
+
+def test_fresh_response_is_served_from_cache(server):
+    http = NebuloidHTTPClient()
+
+    async def run():
+        first = await http.get_json(server + "/fresh")
+        second = await http.get_json(server + "/fresh")
+        await http.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"path": "/fresh"}
+    assert len(StandIn.hits) == 1
+
+def test_stale_response_is_revalidated_with_etag(server):
+    http = NebuloidHTTPClient()
+
+    async def run():
+        first = await http.get_json(server + "/etag")
+        second = await http.get_json(server + "/etag")
+        await http.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"path": "/etag"}
+    assert StandIn.hits == [("/etag", None), ("/etag", '"v1"')]
+
+def test_no_store_is_not_cached(server):
+    http = NebuloidHTTPClient()
+
+    async def run():
+        await http.get_json(server + "/plain")
+        await http.get_json(server + "/plain")
+        await http.aclose()
+
+    asyncio.run(run())
+    assert len(StandIn.hits) == 2
+
+@pytest.mark.parametrize("limit", [1, 3])
+def test_per_host_limit_is_kept_per_source(server, limit):
+    http = NebuloidHTTPClient(per_host=10)
+
+    async def run():
+        # a source with a different limit for the same host must not change this one's
+        await http.get_json(server + "/slow/warmup", max_per_host=10)
+        StandIn.peak = 0
+        await asyncio.gather(*(http.get_json(server + f"/slow/{i}", max_per_host=limit) for i in range(6)))
+        await http.aclose()
+
+    asyncio.run(run())
+    assert StandIn.peak == limit
+
+def test_client_is_closed_with_its_loop(server):
+    http = NebuloidHTTPClient()
+
+    async def run():
+        await http.get_json(server + "/plain")
+        client, _, _ = await http._client()
+        return client
+
+    # asyncio.run() shuts the loop's async generators down, as Flask's per-request loops do
+    first = asyncio.run(run())
+    assert first.is_closed
+    second = asyncio.run(run())
+    assert second is not first and second.is_closed
+    assert len(http._clients) == 1
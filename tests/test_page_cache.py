@@ -0,0 +1,42 @@
+import os
+
+from jinja2 import DictLoader, Environment
+
+from nebuloid.builder.page_cache import NebuloidCacheExtension
+from nebuloid.builder.plan import compile_plan, plan_mtime
+from nebuloid.core.cache import NebuloidCache
+
+def test_edited_template_does_not_reuse_fragments():
+    templates = {"page.html": "{% cache 'nav', 1 %}old{% endcache %}"}
+    env = Environment(loader=DictLoader(templates), extensions=[NebuloidCacheExtension])
+    env.fragment_cache = NebuloidCache()
+
+    assert env.get_template("page.html").render() == "old"
+    templates["page.html"] = "{% cache 'nav', 1 %}new{% endcache %}"
+    assert env.get_template("page.html").render() == "new"
+    assert len(env.fragment_cache) == 2
+
+def test_unchanged_template_reuses_fragments():
+    templates = {"page.html": "{% cache 'nav', n %}{{ n }}-{{ m }}{% endcache %}"}
+    env = Environment(loader=DictLoader(templates), extensions=[NebuloidCacheExtension])
+    env.fragment_cache = NebuloidCache()
+
+    assert env.get_template("page.html").render(n=1, m=1) == "1-1"
+    assert env.get_template("page.html").render(n=1, m=2) == "1-1"
+    assert env.get_template("page.html").render(n=2, m=2) == "2-2"
+
+def test_plan_is_stale_when_access_yaml_changes(tmp_path):
+    route = tmp_path / "home"
+    route.mkdir()
+    (route / "recipe.yaml").write_text("page:\n  template: index.html\n  cache: {ttl: 60}\n")
+
+    plan = compile_plan(str(tmp_path), "home")
+    assert plan.mtime == plan_mtime(str(tmp_path), "home")
+    assert plan.cache["ttl"] == 60
+
+    (route / "access.yaml").write_text("cache: {ttl: 5}\n")
+    assert plan.mtime != plan_mtime(str(tmp_path), "home")
+    assert compile_plan(str(tmp_path), "home").cache["ttl"] == 5
+
+    os.utime(route / "access.yaml", ns=(1, 1))
+    assert compile_plan(str(tmp_path), "home").mtime[1] == 1
@@ -0,0 +1,75 @@
+import pytest
+
+from nebuloid.core.router import NebuloidRouter, system_branch
+
+ROUTES = {
+    "/": "home",
+    "/orders": ["orders_admin", "orders"],
+    "/item/<int:id>": "item",
+    "/item/new": "item_new",
+    "/item/<slug>": "item_slug",
+    "/user/<name>/posts/<int:post>": "post",
+    "/files/<path:rest>": "files",
+    "/docs/*": "docs",
+    "/docs/index": "docs_index",
+}
+
+@pytest.fixture(scope="module")
+def router():
+    return NebuloidRouter.compile(ROUTES)
+
+def test_exact_routes(router):
+    assert router.match("/").candidates == ("home",)
+    assert router.match("/orders").candidates == ("orders_admin", "orders")
+    assert router.match("/orders/").candidates == ("orders_admin", "orders")
+    assert router.match("/orders").params == {}
+
+def test_static_segment_wins_over_parameters(router):
+    assert router.match("/item/new").candidates == ("item_new",)
+    assert router.match("/docs/index").candidates == ("docs_index",)
+
+def test_converters_are_tried_in_order(router):
+    match = router.match("/item/42")
+    assert match.candidates == ("item",)
+    assert match.params == {"id": 42}
+
+    match = router.match("/item/blue-shirt")
+    assert match.candidates == ("item_slug",)
+    assert match.params == {"slug": "blue-shirt"}
+
+def test_several_parameters(router):
+    match = router.match("/user/ada/posts/7")
+    assert match.pattern == "/user/<name>/posts/<int:post>"
+    assert match.params == {"name": "ada", "post": 7}
+    assert router.match("/user/ada/posts/seven") is None
+
+def test_wildcards_take_the_rest(router):
+    assert router.match("/files/a/b/c.txt").params == {"rest": "a/b/c.txt"}
+    assert router.match("/docs/guide/intro").params == {"path": "guide/intro"}
+    assert router.match("/files") is None
+
+def test_parameters_win_over_wildcards():
+    router = NebuloidRouter.compile({"/a/<int:id>": "one", "/a/<path:rest>": "rest"})
+    assert router.match("/a/1").candidates == ("one",)
+    assert router.match("/a/1/2").params == {"rest": "1/2"}
+    assert router.match("/a/x").params == {"rest": "x"}
+
+def test_unknown_urls(router):
+    assert router.match("/nope") is None
+    assert router.match("/item") is None
+    assert router.match("/item/1/extra") is None
+
+def test_invalid_patterns():
+    with pytest.raises(ValueError):
+        NebuloidRouter.compile({"/a/<path:rest>/b": "x"})
+    with pytest.raises(ValueError):
+        NebuloidRouter.compile({"/a/<float:x>": "x"})
+
+def test_system_branches():
+    assert system_branch("/api") == "api"
+    assert system_branch("/api_ws") == "api"
+    assert system_branch("/static_home/app.css") == "static"
+    assert system_branch("/plugin_view/abc") == "plugin"
+    assert system_branch("/utils_tools.js") == "utils"
+    assert system_branch("/orders") is None
+    assert system_branch("/my_page") is None
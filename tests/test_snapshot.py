@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+def touch(path, text):
+    path.write_text(text)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))  # past the filesystem's mtime granularity
+
+def test_access_yaml_edit_swaps_a_new_snapshot(make_app, project):
+    app = make_app()
+    client = app.app.test_client()
+    before = app.server.snapshot
+    assert client.get("/").status_code == 200
+
+    touch(project / "pages" / "home" / "access.yaml", "access:\n  roles_allowed: admin\n")
+    changed = asyncio.run(app.server.reloader.reload())
+    assert changed == [os.path.join("pages", "home", "access.yaml")]
+
+    after = app.server.snapshot
+    assert after.version == before.version + 1
+    assert after.access.policies["home"].role_mask
+    assert before.access.policies["home"].open  # requests holding the old snapshot keep their view
+    assert client.get("/").status_code == 404
+
+    assert asyncio.run(app.server.reloader.reload()) == []
+    assert app.server.snapshot is after
+
+def test_manifest_edit_recompiles_routes(make_app, project):
+    app = make_app()
+    client = app.app.test_client()
+    assert client.get("/start").status_code == 404
+
+    path = project / "nucleus" / "manifest.neb"
+    data = json.loads(path.read_text())
+    data["server"]["routes"]["/start"] = "home"
+    touch(path, json.dumps(data))
+    asyncio.run(app.server.reloader.reload())
+
+    assert app.manifest.data is app.server.snapshot.data
+    assert app.server.snapshot.data["server"]["routes"]["/start"] == "home"
+    assert client.get("/start").status_code == 200
+
+def test_broken_edit_keeps_the_last_good_snapshot(make_app, project):
+    app = make_app()
+    before = app.server.snapshot
+
+    path = project / "nucleus" / "manifest.neb"
+    good = path.read_text()
+    touch(path, "{ not json")
+    with pytest.raises(ValueError):
+        asyncio.run(app.server.reloader.reload())
+    assert app.server.snapshot is before
+
+    # reported once, not on every tick
+    assert asyncio.run(app.server.reloader.reload()) == []
+
+    touch(path, good)
+    asyncio.run(app.server.reloader.reload())
+    assert app.server.snapshot.version == before.version + 1
+
+def test_plugins_get_a_mutable_copy_of_their_config(make_app, project):
+    (project / "nucleus" / "plugins" / "demo.py").write_text(
+        "seen = {}\n"
+        "def mount(ctx):\n"
+        "    ctx.args['options'].append('added')\n"
+        "    seen['config'] = ctx.args\n"
+    )
+    app = make_app(plugins={"demo": {"options": ["a"]}})
+
+    config = app.plugins.plugins["demo"]["instance"].seen["config"]
+    assert config == {"options": ["a", "added"]}
+    assert app.manifest.data["plugins"]["demo"]["options"] == ("a",)
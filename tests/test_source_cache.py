@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from nebuloid.builder.source_cache import NebuloidSourceCache
+from nebuloid.manifest.manifest import freeze
+
+def source(query, ttl=60, name="stats"):
+    return freeze({"name": name, "type": "sql", "query": query, "cache": {"ttl": ttl, "scope": "global"}})
+
+def fetch_count(cache, src):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {"status": "success", "rows": len(calls)}
+
+    async def run():
+        await cache.get(src, None, fetch)
+        await cache.get(src, None, fetch)
+    asyncio.run(run())
+    return len(calls)
+
+def test_signatures_are_replaced_on_recompile():
+    cache = NebuloidSourceCache(orm=None)
+    for i in range(50):
+        cache.register("home", (source(f"SELECT {i}"),))
+    assert len(cache.signatures["stats"]) == 1
+
+def test_same_name_different_recipes_do_not_share_results():
+    cache = NebuloidSourceCache(orm=None)
+    home, admin = source("SELECT 1"), source("SELECT 2")
+    cache.register("home", (home,))
+    cache.register("admin", (admin,))
+    assert cache.signature(home) != cache.signature(admin)
+    assert fetch_count(cache, home) == 1
+    assert fetch_count(cache, admin) == 1
+    assert fetch_count(cache, home) == 0
+
+def test_mismatched_settings_for_the_same_name_raise():
+    cache = NebuloidSourceCache(orm=None)
+    cache.register("home", (source("SELECT 1", ttl=60),))
+    with pytest.raises(ValueError):
+        cache.register("admin", (source("SELECT 1", ttl=5),))
+
+    fetch_count(cache, source("SELECT 1", ttl=60))
+    with pytest.raises(ValueError):
+        fetch_count(cache, source("SELECT 1", ttl=5))
+
+def test_recompiled_recipe_may_change_its_settings():
+    cache = NebuloidSourceCache(orm=None)
+    cache.register("home", (source("SELECT 1", ttl=60),))
+    fetch_count(cache, source("SELECT 1", ttl=60))
+    cache.register("home", (source("SELECT 1", ttl=5),))
+    assert fetch_count(cache, source("SELECT 1", ttl=5)) == 1
+    assert cache.caches["stats"].ttl == 5
+
+def test_dropped_source_no_longer_constrains_other_recipes():
+    cache = NebuloidSourceCache(orm=None)
+    home = source("SELECT 1", ttl=60)
+    cache.register("home", (home,))
+    fetch_count(cache, home)
+
+    cache.register("home", ())  # the recipe no longer has `stats`
+    assert "stats" not in cache.settings and "stats" not in cache.signatures
+    assert "stats" not in cache.caches
+
+    admin = source("SELECT 2", ttl=5)
+    cache.register("admin", (admin,))
+    assert fetch_count(cache, admin) == 1
+
+def test_concurrent_misses_share_one_fetch():
+    cache = NebuloidSourceCache(orm=None)
+    src = source("SELECT 1")
+    cache.register("home", (src,))
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"status": "success"}
+
+    async def run():
+        return await asyncio.gather(*(cache.get(src, None, fetch) for _ in range(500)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == {"status": "success"} for result in results)
+    assert cache.inflight == {}
+
+def test_failed_fetch_is_not_cached():
+    cache = NebuloidSourceCache(orm=None)
+    src = source("SELECT 1")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {"status": "error", "message": "down"}
+
+    async def run():
+        await cache.get(src, None, fetch)
+        await cache.get(src, None, fetch)
+    asyncio.run(run())
+    assert len(calls) == 2
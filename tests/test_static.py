@@ -0,0 +1,56 @@
+import gzip
+import os
+
+def test_static_file_is_served(make_app):
+    client = make_app().app.test_client()
+    response = client.get("/static_home/app.css")
+    assert response.status_code == 200
+    assert response.data.startswith(b"body")
+
+def test_static_route_name_cannot_leave_base_dir(make_app, project):
+    (project / "secret").mkdir()
+    (project / "secret" / "s.txt").write_text("secret")
+    (project / "static").mkdir()
+    (project / "static" / "s.txt").write_text("secret")
+
+    client = make_app().app.test_client()
+    for url in ("/static_../secret/s.txt", "/static_../s.txt", "/static_home/../../secret/s.txt", "/static_home/../../../etc/passwd"):
+        response = client.get(url)
+        assert response.status_code == 404, url
+        assert b"secret" not in response.data
+
+def test_precompressed_asset_respects_q_values(make_app):
+    app = make_app()
+    client = app.app.test_client()
+    name, (path, _) = next((name, asset) for name, asset in app.server.builder.assets.files.items() if name.startswith("tools."))
+    with open(path, "rb") as f:
+        plain = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(plain))
+    app.server.builder.assets.files[name] = (path, ("gzip",))
+
+    response = client.get(f"/utils_{name}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") == "gzip"
+    assert gzip.decompress(response.data) == plain
+
+    for refused in ("gzip;q=0", "identity", "br", "*;q=0"):
+        response = client.get(f"/utils_{name}", headers={"Accept-Encoding": refused})
+        assert "Content-Encoding" not in response.headers, refused
+        assert response.data == plain
+
+def test_deleted_asset_is_a_404(make_app):
+    app = make_app()
+    client = app.app.test_client()
+    name, (path, _) = next((name, asset) for name, asset in app.server.builder.assets.files.items() if name.startswith("tools."))
+    os.remove(path)
+    assert client.get(f"/utils_{name}").status_code == 404
+
+def test_cached_asset_respects_q_values(make_app):
+    client = make_app(cache={"assets": {"max_bytes": 1024 * 1024}}).app.test_client()
+
+    response = client.get("/static_home/app.css", headers={"Accept-Encoding": "gzip"})
+    assert response.headers.get("Content-Encoding") == "gzip"
+
+    response = client.get("/static_home/app.css", headers={"Accept-Encoding": "br;q=0, gzip;q=0"})
+    assert "Content-Encoding" not in response.headers
+    assert response.data.startswith(b"body")
@@ -0,0 +1,30 @@
+import pytest
+
+def test_plugin_util_registered_before_indexing_cannot_shadow(make_app, project):
+    builder = make_app().server.builder
+    (project / "shared" / "theme.css").write_text("body {}")
+
+    # plugins mount before ready() indexes the built-in utils
+    builder.utils_index = {}
+    builder.register_util("theme.css", str(project / "plugin" / "theme.css"))
+    with pytest.raises(ValueError, match="theme.css"):
+        builder.index_utils(str(project / "shared"))
+
+def test_plugin_util_registered_after_indexing_cannot_shadow(make_app):
+    builder = make_app().server.builder
+    assert "tools.js" in builder.utils_index
+    with pytest.raises(ValueError, match="tools.js"):
+        builder.register_util("tools.js", "/elsewhere/tools.js")
+
+def test_plugin_util_is_served(make_app, project):
+    app = make_app()
+    (project / "extra.js").write_text("export const x = 1;")
+    app.server.builder.register_util("extra.js", str(project / "extra.js"))
+    app.server.builder.register_util("extra.js", str(project / "extra.js"))  # same file twice is fine
+
+    response = app.app.test_client().get("/utils_extra.js")
+    assert response.status_code == 200
+    assert b"export const x" in response.data
+
+    app.server.builder.index_utils(str(project / "shared"))
+    assert app.server.builder.utils_index["extra.js"] == str(project / "extra.js")